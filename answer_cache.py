@@ -0,0 +1,120 @@
+# File: answer_cache.py
+
+import threading
+from collections import OrderedDict
+import numpy as np
+from lexical_index import tokenize
+from metrics import log
+
+class AnswerCache:
+    """
+    Size-bounded LRU of generated answers per document (or per set of
+    documents), keyed by vector_store.get_documents_key(): each document's
+    hash and content hash, joined with "+".
+    Lookups try the normalized question text first, then fall back to the
+    most similar cached question of the same document (cosine similarity of
+    the question embeddings) when it clears `threshold` and mentions the same
+    numbers and identifiers: "item 101" and "item 102", or "Section 4.2" and
+    "Section 4.3", embed almost identically but need different answers.
+    """
+
+    def __init__(self, max_entries: int = 5000, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.entries = OrderedDict()  # (doc_hash, normalized question) -> (unit embedding, answer)
+        self.by_document = {}  # doc_hash -> set of entry keys
+        self.matrices = {}  # doc_hash -> (keys, stacked embeddings), rebuilt after changes
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    @staticmethod
+    def identifiers(question: str) -> frozenset:
+        """The question's tokens containing a digit, e.g. "4.2", "101" or "covid19"."""
+        return frozenset(token for token in tokenize(question) if any(c.isdigit() for c in token))
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _nearest(self, doc_hash: str, vector: np.ndarray, identifiers: frozenset):
+        """Returns (key, similarity) of the closest cached question for this document with the same identifiers."""
+        if doc_hash not in self.matrices:
+            keys = [key for key in self.by_document.get(doc_hash, ()) if self.entries[key][0] is not None]
+            if not keys:
+                return None, 0.0
+            self.matrices[doc_hash] = (
+                keys, np.stack([self.entries[key][0] for key in keys]), [self.identifiers(key[1]) for key in keys]
+            )
+        keys, matrix, key_identifiers = self.matrices[doc_hash]
+        scores = matrix @ vector
+        for position, other in enumerate(key_identifiers):
+            if other != identifiers:
+                scores[position] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            return None, 0.0
+        return keys[best], float(scores[best])
+
+    def get(self, doc_hash: str, question: str, embedding=None):
+        """Returns a cached answer for the question, or None."""
+        key = (doc_hash, self.normalize(question))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[1]
+
+            if embedding is not None:
+                nearest, similarity = self._nearest(doc_hash, self._unit(embedding), self.identifiers(question))
+                if nearest is not None and similarity >= self.threshold:
+                    self.entries.move_to_end(nearest)
+                    self.semantic_hits += 1
+                    log(f"Answer cache: near-duplicate question (similarity {similarity:.3f})")
+                    return self.entries[nearest][1]
+
+            self.misses += 1
+            return None
+
+    def put(self, doc_hash: str, question: str, embedding, answer: str):
+        key = (doc_hash, self.normalize(question))
+        vector = self._unit(embedding) if embedding is not None else None
+        with self.lock:
+            self.entries[key] = (vector, answer)
+            self.entries.move_to_end(key)
+            self.by_document.setdefault(doc_hash, set()).add(key)
+            self.matrices.pop(doc_hash, None)
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self.by_document[evicted[0]].discard(evicted)
+                self.matrices.pop(evicted[0], None)
+
+    def invalidate(self, doc_hash: str):
+        """Drops every answer involving a document, e.g. when it is re-ingested."""
+        with self.lock:
+            stale = [
+                key for key in self.by_document
+                if doc_hash in (part.split(":", 1)[0] for part in key.split("+"))
+            ]
+            for documents_key in stale:
+                for key in self.by_document.pop(documents_key):
+                    self.entries.pop(key, None)
+                self.matrices.pop(documents_key, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# File: benchmarks/chunking.py
+"""
+Chunking benchmark: splits the extracted text of a large synthetic PDF
+(the same page text fake_upstreams.py serves) with chunker.PageChunker
+and, when LangChain is installed, with the LangChain splitter and Document
+objects it replaced, fed page by page the way ingestion used to. Reports
+throughput and tracemalloc peak memory with every chunk kept, and checks
+that both splitters cut the whole text into identical chunks. Streamed
+chunks differ near page boundaries: the old loop let chunks run across
+pages, while PageChunker splits each page on its own.
+
+It also deletes random single lines and counts the chunks whose text
+changed, i.e. what an incremental re-ingestion has to re-embed. With
+boundaries anchored at pages, an edit only touches its own page's chunks.
+
+    python benchmarks/chunking.py --pages 2000 --trials 3
+    pip install langchain-text-splitters langchain-core   # to include the comparison
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import random
+
+from chunker import PageChunker, split_text, CHUNK_SIZE, CHUNK_OVERLAP, SEPARATORS
+from fake_upstreams import page_lines
+
+# The old loop split its buffer once it held this many characters
+LEGACY_SPLIT_THRESHOLD = 2000
+
+def document_pages(pages: int, lines: int) -> list:
+    """(page number, text) per page; every tenth line ends a paragraph so all separators occur."""
+    result = []
+    for page in range(1, pages + 1):
+        text = "\n".join(line + ("\n" if i % 10 == 9 else "") for i, line in enumerate(page_lines("bench", page, lines)))
+        result.append((page, text))
+    return result
+
+def chunk_with_chunker(pages: list) -> list:
+    chunker = PageChunker("bench")
+    chunks = []
+    for page_number, text in pages:
+        chunks.extend(chunker.add_page(page_number, text))
+    chunks.extend(chunker.finish())
+    return chunks
+
+def chunk_with_langchain(pages: list) -> list:
+    """The previous ingestion loop: a growing string buffer, LangChain splits and Documents."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from langchain_core.documents import Document
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len, separators=list(SEPARATORS)
+    )
+    chunks = []
+    buffer = ""
+    page_starts = []
+
+    def locate(texts: list) -> list:
+        located = []
+        search_from = 0
+        for text in texts:
+            offset = buffer.find(text, search_from)
+            if offset < 0:
+                offset = search_from
+            search_from = offset + 1
+            page = page_starts[0][1]
+            for page_offset, page_number in page_starts:
+                if page_offset > offset:
+                    break
+                page = page_number
+            located.append((text, offset, page))
+        return located
+
+    def emit(text: str, page: int):
+        chunks.append(Document(page_content=text, metadata={"source": "bench", "chunk": len(chunks), "page": page}))
+
+    for page_number, page_text in pages:
+        page_starts.append((len(buffer), page_number))
+        buffer += page_text + "\n"
+        if len(buffer) < LEGACY_SPLIT_THRESHOLD:
+            continue
+        located = locate(splitter.split_text(buffer))
+        for text, _, page in located[:-1]:
+            emit(text, page)
+        if located:
+            carried, carried_offset, carried_page = located[-1]
+            page_starts = [(0, carried_page)] + [
+                (offset - carried_offset, number) for offset, number in page_starts if offset > carried_offset
+            ]
+            buffer = carried + "\n"
+        else:
+            buffer, page_starts = "", []
+    if page_starts:
+        for text, _, page in locate(splitter.split_text(buffer)):
+            emit(text, page)
+    return chunks
+
+def measure(split, pages: list, trials: int) -> dict:
+    seconds = []
+    for _ in range(trials):
+        started = time.perf_counter()
+        chunks = split(pages)
+        seconds.append(time.perf_counter() - started)
+    del chunks
+    # Peak memory is measured in a separate run: tracemalloc slows allocation down
+    tracemalloc.start()
+    chunks = split(pages)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    characters = sum(len(text) + 1 for _, text in pages)
+    median = statistics.median(seconds)
+    return {
+        "chunks": chunks,
+        "seconds": median,
+        "mb_per_second": characters / median / 1e6,
+        "chunks_per_second": len(chunks) / median,
+        "peak_mb": peak / 1e6,
+    }
+
+def changed_chunks(pages: list, edits: int, seed: int = 0) -> list:
+    """Chunks with new text after each of `edits` random single-line deletions."""
+    original = {chunk.text for chunk in chunk_with_chunker(pages)}
+    rng = random.Random(seed)
+    counts = []
+    for _ in range(edits):
+        index = rng.randrange(len(pages))
+        page_number, text = pages[index]
+        lines = text.split("\n")
+        del lines[rng.randrange(len(lines))]
+        edited = pages[:index] + [(page_number, "\n".join(lines))] + pages[index + 1:]
+        counts.append(sum(chunk.text not in original for chunk in chunk_with_chunker(edited)))
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=40, help="Lines of text per page")
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--edits", type=int, default=30, help="Random single-line deletions to re-chunk after")
+    args = parser.parse_args()
+
+    pages = document_pages(args.pages, args.lines)
+    size_mb = sum(len(text) + 1 for _, text in pages) / 1e6
+    print(f"{args.pages} pages, {size_mb:.1f} MB of text, median of {args.trials} trials")
+
+    results = {"chunker": measure(chunk_with_chunker, pages, args.trials)}
+    try:
+        results["langchain"] = measure(chunk_with_langchain, pages, args.trials)
+    except ImportError:
+        print("LangChain is not installed; measuring chunker.py only")
+
+    print(f"{'splitter':<12}{'chunks':>8}{'seconds':>10}{'MB/s':>8}{'chunks/s':>11}{'peak MB':>10}")
+    for name, result in results.items():
+        print(f"{name:<12}{len(result['chunks']):>8}{result['seconds']:>10.3f}{result['mb_per_second']:>8.2f}"
+              f"{result['chunks_per_second']:>11.0f}{result['peak_mb']:>10.1f}")
+
+    if "langchain" in results:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len, separators=list(SEPARATORS)
+        )
+        text = "\n".join(page_text for _, page_text in pages)
+        identical = split_text(text) == splitter.split_text(text)
+        print(f"whole-text splits identical: {identical}")
+        ours = [chunk.text for chunk in results["chunker"]["chunks"]]
+        theirs = [doc.page_content for doc in results["langchain"]["chunks"]]
+        same = sum(a == b for a, b in zip(ours, theirs))
+        print(f"streamed chunks identical: {same}/{max(len(ours), len(theirs))}")
+
+    if args.edits:
+        counts = changed_chunks(pages, args.edits)
+        print(f"chunks changed by one deleted line ({args.edits} edits): "
+              f"mean {statistics.mean(counts):.1f}, max {max(counts)}")
+
+if __name__ == "__main__":
+    main()
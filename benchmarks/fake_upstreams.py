@@ -0,0 +1,382 @@
+# File: benchmarks/fake_upstreams.py
+"""
+Local stand-ins for the services the API depends on, for offline benchmarks:
+
+- Jina embeddings (POST /v1/embeddings): deterministic bag-of-words vectors
+- Groq chat completions (POST /openai/v1/chat/completions): plain, JSON-mode
+  batched and streamed answers, with token usage
+- Pinecone control plane (/indexes) and data plane (upsert, query,
+  describe_index_stats, delete) backed by an in-memory NumPy index
+- Synthetic PDFs (GET /docs/{name}.pdf?pages=N)
+
+Each upstream has its own latency distribution and error rates, set by a
+JSON profile (see DEFAULT_PROFILE). Point the app at it with:
+
+    JINA_API_URL=http://127.0.0.1:8900/v1/embeddings
+    GROQ_BASE_URL=http://127.0.0.1:8900
+    PINECONE_CONTROLLER_HOST=http://127.0.0.1:8900
+
+Run standalone: python benchmarks/fake_upstreams.py --port 8900 [--profile profile.json]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+EMBEDDING_DIMENSION = 768
+
+# Per upstream: latency is log-normal with the given median and p99;
+# error_rate answers 500 and rate_limit_rate answers 429 (both before any work)
+DEFAULT_PROFILE = {
+    "jina": {"median_ms": 120, "p99_ms": 600, "error_rate": 0.0, "rate_limit_rate": 0.0, "per_item_ms": 2},
+    "groq": {"median_ms": 400, "p99_ms": 2000, "error_rate": 0.0, "rate_limit_rate": 0.0, "tokens_per_second": 500},
+    "pinecone": {"median_ms": 20, "p99_ms": 120, "error_rate": 0.0, "rate_limit_rate": 0.0},
+    "documents": {"median_ms": 50, "p99_ms": 300, "error_rate": 0.0, "rate_limit_rate": 0.0},
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+def load_profile(path: str = None) -> dict:
+    """DEFAULT_PROFILE, with any upstream settings from the JSON file at path merged over it."""
+    profile = {name: dict(settings) for name, settings in DEFAULT_PROFILE.items()}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for name, settings in json.load(f).items():
+                profile.setdefault(name, {}).update(settings)
+    return profile
+
+class Upstream:
+    """Latency and failure injection for one fake service."""
+
+    def __init__(self, name: str, settings: dict, rng: random.Random):
+        self.name = name
+        self.settings = settings
+        self.rng = rng
+        median = max(settings.get("median_ms", 0), 0.001) / 1000
+        p99 = max(settings.get("p99_ms", 0) / 1000, median)
+        self.mu = math.log(median)
+        # p99 of a log-normal is exp(mu + 2.326 sigma)
+        self.sigma = math.log(p99 / median) / 2.326
+        self.requests = 0
+        self.failures = 0
+        self.bytes_received = 0  # Request bodies (counted where payload size matters)
+        self.bytes_sent = 0      # Response bodies (likewise)
+
+    def latency(self, extra_ms: float = 0.0) -> float:
+        return self.rng.lognormvariate(self.mu, self.sigma) + extra_ms / 1000
+
+    def failure(self):
+        """Returns an error response to send instead of a real answer, or None."""
+        self.requests += 1
+        roll = self.rng.random()
+        if roll < self.settings.get("rate_limit_rate", 0.0):
+            self.failures += 1
+            return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": "1"})
+        if roll < self.settings.get("rate_limit_rate", 0.0) + self.settings.get("error_rate", 0.0):
+            self.failures += 1
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+        return None
+
+    async def wait(self, extra_ms: float = 0.0):
+        await asyncio.sleep(self.latency(extra_ms))
+
+# --- Synthetic content ---
+def fake_embedding(text: str) -> list:
+    """Hashed bag of words: texts sharing words get similar vectors, like a real model would."""
+    vector = np.zeros(EMBEDDING_DIMENSION, dtype=np.float32)
+    for word in WORD_PATTERN.findall(text.lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % EMBEDDING_DIMENSION] += 1.0
+    vector += 1e-3
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def page_lines(name: str, page: int, lines: int = 40) -> list:
+    """Policy-like sentences, unique per document and page so retrieval has something to find."""
+    rng = random.Random(f"{name}:{page}")
+    topics = ["coverage", "premium", "exclusion", "waiting period", "claim", "hospitalisation",
+              "deductible", "renewal", "grace period", "maternity", "AYUSH treatment", "room rent"]
+    return [
+        f"Section {page}.{line + 1}: The {rng.choice(topics)} for item {page * 100 + line} "
+        f"is {rng.randint(1, 90)} days and limited to {rng.randint(1, 50) * 1000} rupees."
+        for line in range(lines)
+    ]
+
+def _escape_pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def synthetic_pdf(name: str, pages: int) -> bytes:
+    """A minimal valid PDF with one page of Helvetica text per page (no external dependencies)."""
+    objects = []  # bodies of objects 1..n
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    page_tree = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for page in range(1, pages + 1):
+        text = "\n".join(f"({_escape_pdf_text(line)}) Tj T*" for line in page_lines(name, page))
+        stream = f"BT /F1 9 Tf 11 TL 36 760 Td\n{text}\nET".encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (page_tree, content, font)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+# --- Fake Groq answers ---
+def _answer_text(question: str) -> str:
+    return f"According to the policy, the answer to '{question.strip()}' is stated in the relevant section."
+
+def _completion_answer(body: dict) -> str:
+    prompt = body["messages"][-1]["content"]
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        # Batched prompt: numbered question lines after "Questions:"
+        questions = re.findall(r"^(\d+)\. (.*?)(?: \(passages:.*\))?$", prompt.split("Questions:", 1)[-1], re.M)
+        return json.dumps({"answers": [{"index": int(i), "answer": _answer_text(q)} for i, q in questions]})
+    question = re.search(r"Question: (.*)", prompt)
+    return _answer_text(question.group(1) if question else prompt[-80:])
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+# --- Fake Pinecone ---
+class _FakeIndex:
+    def __init__(self):
+        self.namespaces = {}  # namespace -> {id: (vector, metadata)}
+        self.lock = threading.Lock()
+
+    def upsert(self, vectors: list, namespace: str) -> int:
+        with self.lock:
+            space = self.namespaces.setdefault(namespace, {})
+            for vector in vectors:
+                space[vector["id"]] = (np.asarray(vector["values"], dtype=np.float32), vector.get("metadata") or {})
+        return len(vectors)
+
+    def query(self, vector: list, top_k: int, namespace: str, include_metadata: bool) -> list:
+        with self.lock:
+            items = list(self.namespaces.get(namespace, {}).items())
+        if not items:
+            return []
+        matrix = np.stack([values for _, (values, _) in items])
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * max(np.linalg.norm(query), 1e-9) + 1e-9)
+        top = np.argsort(-scores)[:top_k]
+        return [
+            {"id": items[i][0], "score": float(scores[i]), "values": [],
+             **({"metadata": items[i][1][1]} if include_metadata else {})}
+            for i in top
+        ]
+
+    def delete(self, namespace: str, ids=None, delete_all: bool = False):
+        with self.lock:
+            if delete_all or ids is None:
+                self.namespaces.pop(namespace, None)
+            else:
+                space = self.namespaces.get(namespace, {})
+                for vector_id in ids:
+                    space.pop(vector_id, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            counts = {name: len(space) for name, space in self.namespaces.items()}
+        return {
+            "namespaces": {name: {"vectorCount": count} for name, count in counts.items()},
+            "dimension": EMBEDDING_DIMENSION, "indexFullness": 0.0,
+            "totalVectorCount": sum(counts.values()), "metric": "cosine", "vectorType": "dense",
+        }
+
+# --- App ---
+def create_app(profile: dict = None, seed: int = 0) -> FastAPI:
+    profile = profile or load_profile()
+    rng = random.Random(seed)
+    upstreams = {name: Upstream(name, settings, rng) for name, settings in profile.items()}
+    indexes = {}
+    app = FastAPI(title="Fake upstreams")
+
+    def index_description(request: Request, name: str) -> dict:
+        return {
+            "name": name, "dimension": EMBEDDING_DIMENSION, "metric": "cosine",
+            "host": f"{request.url.scheme}://{request.url.netloc}",
+            "spec": {"serverless": {"cloud": "aws", "region": "us-east-1"}},
+            "status": {"ready": True, "state": "Ready"},
+            "deletion_protection": "disabled", "vector_type": "dense", "tags": None,
+            # Newer API versions describe the shape through schema/deployment instead
+            "schema": {"fields": {"values": {"type": "dense_vector", "dimension": EMBEDDING_DIMENSION, "metric": "cosine"}}},
+            "deployment": {"deployment_type": "managed", "cloud": "aws", "region": "us-east-1"},
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        jina = upstreams["jina"]
+        failure = jina.failure()
+        if failure is not None:
+            return failure
+        body = await request.json()
+        texts = body["input"]
+        await jina.wait(jina.settings.get("per_item_ms", 0) * len(texts))
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(t)} for i, t in enumerate(texts)]
+        tokens = sum(len(t) // 4 + 1 for t in texts)
+        return {"model": body.get("model"), "object": "list", "data": data,
+                "usage": {"total_tokens": tokens, "prompt_tokens": tokens}}
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        groq = upstreams["groq"]
+        failure = groq.failure()
+        if failure is not None:
+            return failure
+        body = await request.json()
+        answer = _completion_answer(body)
+        prompt_tokens = sum(len(m["content"]) // 4 + 1 for m in body["messages"])
+        completion_tokens = len(answer) // 4 + 1
+        generation_ms = 1000 * completion_tokens / groq.settings.get("tokens_per_second", 500)
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await groq.wait(generation_ms)
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+                "usage": _usage(prompt_tokens, completion_tokens),
+            }
+
+        async def events():
+            await groq.wait()  # Time to first token
+            words = answer.split(" ")
+            for position, word in enumerate(words):
+                await asyncio.sleep(generation_ms / 1000 / len(words))
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": word + (" " if position < len(words) - 1 else "")},
+                                 "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": body["model"],
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "x_groq": {"id": "fake", "usage": _usage(prompt_tokens, completion_tokens)},
+            }
+            yield f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/indexes")
+    async def list_indexes(request: Request):
+        await upstreams["pinecone"].wait()
+        return {"indexes": [index_description(request, name) for name in indexes]}
+
+    @app.post("/indexes")
+    async def create_index(request: Request):
+        body = await request.json()
+        indexes.setdefault(body["name"], _FakeIndex())
+        return JSONResponse(index_description(request, body["name"]), status_code=201)
+
+    @app.get("/indexes/{name}")
+    async def describe_index(request: Request, name: str):
+        # Every index name exists, so the app can connect without creating one first
+        indexes.setdefault(name, _FakeIndex())
+        return index_description(request, name)
+
+    def data_index() -> _FakeIndex:
+        # Data-plane requests do not name the index; the fake serves one
+        return indexes.setdefault("default", _FakeIndex()) if not indexes else next(iter(indexes.values()))
+
+    @app.post("/vectors/upsert")
+    async def upsert(request: Request):
+        pinecone = upstreams["pinecone"]
+        failure = pinecone.failure()
+        if failure is not None:
+            return failure
+        raw = await request.body()
+        pinecone.bytes_received += len(raw)
+        body = json.loads(raw)
+        await pinecone.wait()
+        return {"upsertedCount": data_index().upsert(body["vectors"], body.get("namespace", ""))}
+
+    @app.post("/query")
+    async def query(request: Request):
+        pinecone = upstreams["pinecone"]
+        failure = pinecone.failure()
+        if failure is not None:
+            return failure
+        body = await request.json()
+        await pinecone.wait()
+        matches = data_index().query(
+            body["vector"], body.get("topK", 10), body.get("namespace", ""), body.get("includeMetadata", False)
+        )
+        response = {"matches": matches, "namespace": body.get("namespace", ""), "usage": {"readUnits": 1}}
+        pinecone.bytes_sent += len(json.dumps(response))
+        return response
+
+    @app.post("/describe_index_stats")
+    async def describe_index_stats():
+        await upstreams["pinecone"].wait()
+        return data_index().stats()
+
+    @app.post("/vectors/delete")
+    async def delete(request: Request):
+        body = await request.json()
+        data_index().delete(body.get("namespace", ""), body.get("ids"), body.get("deleteAll", False))
+        return {}
+
+    @app.get("/docs/{name}.pdf")
+    async def document(name: str, pages: int = 10):
+        documents = upstreams["documents"]
+        failure = documents.failure()
+        if failure is not None:
+            return failure
+        await documents.wait()
+        body = synthetic_pdf(name, pages)
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        return Response(body, media_type="application/pdf", headers={"ETag": etag})
+
+    @app.get("/stats")
+    async def stats():
+        """Requests, injected failures and counted payload bytes per upstream."""
+        return {
+            name: {"requests": u.requests, "failures": u.failures,
+                   "bytes_received": u.bytes_received, "bytes_sent": u.bytes_sent}
+            for name, u in upstreams.items()
+        }
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--profile", help="JSON file overriding DEFAULT_PROFILE per upstream")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(load_profile(args.profile), args.seed), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# File: benchmarks/load_test.py
+"""
+Offline load test: runs the API against local stand-ins for Jina, Groq,
+Pinecone and the document host (fake_upstreams.py), drives it at a fixed
+concurrency and reports latency percentiles, throughput and the per-stage
+breakdown scraped from the app's /metrics endpoint.
+
+    python benchmarks/load_test.py --concurrency 8 --requests 40 --pages 5,20,60
+    python benchmarks/load_test.py --save-baseline          # record benchmarks/baseline.json
+    python benchmarks/load_test.py                          # compare against it; exits 1 on regression
+
+Nothing leaves the machine: API keys are dummies and every upstream URL
+points at the fake server.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+from prometheus_client.parser import text_string_to_metric_families
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+AUTH_TOKEN = "benchmark-token"
+
+QUESTION_TEMPLATES = [
+    "What is the waiting period for item {item}?",
+    "What is the coverage limit for item {item}?",
+    "How many days apply to item {item} under section {page}.{line}?",
+    "Is {topic} covered, and what is the limit?",
+    "What does section {page}.{line} say about {topic}?",
+]
+TOPICS = ["maternity", "AYUSH treatment", "room rent", "the grace period", "renewal", "hospitalisation"]
+
+# --- Processes ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before becoming ready")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+def start_fake_upstreams(port: int, profile: str, seed: int) -> subprocess.Popen:
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, "fake_upstreams.py"), "--port", str(port), "--seed", str(seed)]
+    if profile:
+        command += ["--profile", profile]
+    process = subprocess.Popen(command, cwd=REPO_DIR)
+    wait_until_up(f"http://127.0.0.1:{port}/stats", process)
+    return process
+
+def app_environment(upstream_port: int, data_dir: str, backend: str, extra_env: dict) -> dict:
+    """Environment running the app against the fake upstreams with dummy keys."""
+    upstream = f"http://127.0.0.1:{upstream_port}"
+    env = dict(os.environ)
+    env.update({
+        "GROQ_API_KEY": "benchmark", "JINA_API_KEY": "benchmark", "PINECONE_API_KEY": "benchmark",
+        "API_AUTH_TOKEN": AUTH_TOKEN,
+        "JINA_API_URL": f"{upstream}/v1/embeddings",
+        "GROQ_BASE_URL": upstream,
+        "PINECONE_CONTROLLER_HOST": upstream,
+        "VECTOR_BACKEND": backend,
+        "DATA_DIR": data_dir,
+    })
+    env.update(extra_env)
+    return env
+
+def launch_app(port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+
+def start_app(port: int, upstream_port: int, data_dir: str, backend: str, extra_env: dict) -> subprocess.Popen:
+    process = launch_app(port, app_environment(upstream_port, data_dir, backend, extra_env))
+    wait_until_up(f"http://127.0.0.1:{port}/", process)
+    return process
+
+def stop(process: subprocess.Popen):
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+# --- Workload ---
+def build_workload(args, upstream_port: int) -> list:
+    """One {'documents', 'questions'} body per request, cycling through the synthetic documents."""
+    rng = random.Random(args.seed)
+    page_counts = [int(p) for p in args.pages.split(",")]
+    documents = [
+        (f"http://127.0.0.1:{upstream_port}/docs/bench-{i}.pdf?pages={page_counts[i % len(page_counts)]}",
+         page_counts[i % len(page_counts)])
+        for i in range(args.documents)
+    ]
+    workload = []
+    for n in range(args.requests):
+        url, pages = documents[n % len(documents)]
+        questions = []
+        for _ in range(args.questions):
+            page, line = rng.randint(1, pages), rng.randint(1, 40)
+            questions.append(rng.choice(QUESTION_TEMPLATES).format(
+                item=page * 100 + line - 1, page=page, line=line, topic=rng.choice(TOPICS)
+            ))
+        workload.append({"documents": url, "questions": questions})
+    return workload
+
+async def drive(base_url: str, workload: list, concurrency: int, endpoint: str, timeout: float) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+    headers = {"Authorization": f"Bearer {AUTH_TOKEN}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, headers=headers) as client:
+        async def one(body: dict):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(endpoint, json=body)
+                    await response.aread()
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one(body) for body in workload])
+        wall = time.perf_counter() - started
+
+    return {"latencies": latencies, "statuses": statuses, "wall_seconds": wall}
+
+# --- Metrics ---
+def scrape_stages(base_url: str) -> dict:
+    """hackrx_stage_seconds per stage (all outcomes): {'count', 'sum', 'buckets': {le: cumulative count}}."""
+    stages = {}
+    text = httpx.get(f"{base_url}/metrics", timeout=10).text
+    for family in text_string_to_metric_families(text):
+        if family.name != "hackrx_stage_seconds":
+            continue
+        for sample in family.samples:
+            stage = stages.setdefault(sample.labels["stage"], {"count": 0.0, "sum": 0.0, "buckets": {}})
+            if sample.name.endswith("_count"):
+                stage["count"] += sample.value
+            elif sample.name.endswith("_sum"):
+                stage["sum"] += sample.value
+            elif sample.name.endswith("_bucket"):
+                le = float(sample.labels["le"])
+                stage["buckets"][le] = stage["buckets"].get(le, 0.0) + sample.value
+    return stages
+
+def histogram_quantile(buckets: dict, quantile: float) -> float:
+    """Linear interpolation inside the bucket holding the quantile, as PromQL's histogram_quantile does."""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if not total:
+        return 0.0
+    rank = quantile * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            width = count - previous_count
+            return previous_bound + (bound - previous_bound) * ((rank - previous_count) / width if width else 0)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    """Per-stage span count, mean and p95 over the run (the difference between two scrapes)."""
+    breakdown = {}
+    for stage, end in sorted(after.items()):
+        start = before.get(stage, {"count": 0.0, "sum": 0.0, "buckets": {}})
+        count = end["count"] - start["count"]
+        if count <= 0:
+            continue
+        buckets = {le: value - start["buckets"].get(le, 0.0) for le, value in end["buckets"].items()}
+        breakdown[stage] = {
+            "count": int(count),
+            "mean": round((end["sum"] - start["sum"]) / count, 4),
+            "p95": round(histogram_quantile(buckets, 0.95), 4),
+        }
+    return breakdown
+
+def summarize(run: dict, stages: dict, args) -> dict:
+    latencies = np.array(run["latencies"])
+    return {
+        "config": {
+            "concurrency": args.concurrency, "requests": args.requests, "documents": args.documents,
+            "pages": args.pages, "questions": args.questions, "backend": args.backend,
+            "endpoint": args.endpoint, "profile": args.profile,
+        },
+        "latency": {
+            "p50": round(float(np.percentile(latencies, 50)), 4),
+            "p95": round(float(np.percentile(latencies, 95)), 4),
+            "p99": round(float(np.percentile(latencies, 99)), 4),
+            "mean": round(float(latencies.mean()), 4),
+            "max": round(float(latencies.max()), 4),
+        },
+        "rps": round(len(latencies) / run["wall_seconds"], 3),
+        "statuses": run["statuses"],
+        "stages": stages,
+    }
+
+def print_report(report: dict):
+    latency = report["latency"]
+    print(f"\nRequests: {sum(report['statuses'].values())}  statuses: {report['statuses']}")
+    print(f"Latency   p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  p99 {latency['p99']:.3f}s  "
+          f"max {latency['max']:.3f}s")
+    print(f"Throughput {report['rps']:.2f} requests/s")
+    print(f"\n{'stage':<18}{'spans':>8}{'mean':>10}{'p95':>10}")
+    for stage, numbers in report["stages"].items():
+        print(f"{stage:<18}{numbers['count']:>8}{numbers['mean']:>9.3f}s{numbers['p95']:>9.3f}s")
+    pinecone = report.get("upstreams", {}).get("pinecone")
+    if pinecone and pinecone.get("bytes_received"):
+        print(f"\nPinecone payloads: {pinecone['bytes_received'] / 1e6:.2f} MB upserted, "
+              f"{pinecone['bytes_sent'] / 1e6:.2f} MB of query responses")
+
+# --- Baseline ---
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a description of every metric that got worse than the baseline by more than tolerance."""
+    regressions = []
+
+    def check(name: str, current: float, previous: float, higher_is_worse: bool = True):
+        if not previous:
+            return
+        change = (current - previous) / previous
+        if (change > tolerance) if higher_is_worse else (change < -tolerance):
+            regressions.append(f"{name}: {previous:.4f} -> {current:.4f} ({change:+.0%})")
+
+    for key in ("p50", "p95", "p99"):
+        check(f"latency {key}", report["latency"][key], baseline["latency"].get(key))
+    check("requests/s", report["rps"], baseline.get("rps"), higher_is_worse=False)
+    for stage, numbers in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous:
+            check(f"stage {stage} mean", numbers["mean"], previous.get("mean"))
+    if baseline.get("config") != report["config"]:
+        print("Warning: baseline was recorded with a different configuration:", baseline.get("config"))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--requests", type=int, default=40, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=0, help="Unmeasured requests sent first")
+    parser.add_argument("--documents", type=int, default=4, help="Distinct synthetic documents")
+    parser.add_argument("--pages", default="5,20,60", help="Page counts, cycled across documents")
+    parser.add_argument("--questions", type=int, default=6, help="Questions per request")
+    parser.add_argument("--endpoint", default="/hackrx/run", help="/hackrx/run or /hackrx/run/stream")
+    parser.add_argument("--backend", default="pinecone", choices=["pinecone", "local"])
+    parser.add_argument("--profile", help="Latency/error profile JSON for fake_upstreams.py")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra app environment")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    parser.add_argument("--output", help="Also write the report JSON here")
+    args = parser.parse_args()
+
+    upstream_port, app_port = free_port(), free_port()
+    data_dir = tempfile.mkdtemp(prefix="hackrx-bench-")
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    upstreams = app = None
+    try:
+        upstreams = start_fake_upstreams(upstream_port, args.profile, args.seed)
+        app = start_app(app_port, upstream_port, data_dir, args.backend, extra_env)
+        base_url = f"http://127.0.0.1:{app_port}"
+        workload = build_workload(args, upstream_port)
+
+        if args.warmup:
+            asyncio.run(drive(base_url, workload[:args.warmup], args.concurrency, args.endpoint, args.timeout))
+        before = scrape_stages(base_url)
+        run = asyncio.run(drive(base_url, workload, args.concurrency, args.endpoint, args.timeout))
+        report = summarize(run, stage_breakdown(before, scrape_stages(base_url)), args)
+        report["upstreams"] = httpx.get(f"http://127.0.0.1:{upstream_port}/stats").json()
+    finally:
+        stop(app)
+        stop(upstreams)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = compare(report, json.load(f), args.tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# File: benchmarks/startup.py
+"""
+Startup benchmark: how long a fresh server process takes to become useful,
+against the local fake upstreams (see fake_upstreams.py).
+
+Per trial, with an empty data directory, it measures from process spawn:
+- import: `import main` in a separate interpreter (module import cost only)
+- listen: first 200 from GET / (liveness)
+- ready: first 200 from GET /ready (vector index connected and checked)
+- first_request: first /hackrx/run answered (small synthetic document)
+
+    python benchmarks/startup.py --trials 5
+    python benchmarks/startup.py --trials 5 --warm      # WARM_UP_ON_STARTUP=true
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from load_test import (
+    REPO_DIR, AUTH_TOKEN, free_port, start_fake_upstreams, app_environment, launch_app, stop
+)
+
+def wait_for(url: str, process: subprocess.Popen, started: float, timeout: float = 60.0) -> float:
+    """Polls url until it answers 200; returns seconds since started."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=5.0).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not answer 200 within {timeout:.0f}s")
+
+def trial(args, upstream_port: int) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="hackrx-startup-")
+    extra_env = {"WARM_UP_ON_STARTUP": "true"} if args.warm else {}
+    env = app_environment(upstream_port, data_dir, args.backend, extra_env)
+    result = {}
+    process = None
+    try:
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=REPO_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        result["import"] = time.perf_counter() - started
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        started = time.perf_counter()
+        process = launch_app(port, env)
+        result["listen"] = wait_for(f"{base_url}/", process, started)
+        result["ready"] = wait_for(f"{base_url}/ready", process, started)
+        body = {
+            "documents": f"http://127.0.0.1:{upstream_port}/docs/startup.pdf?pages={args.pages}",
+            "questions": ["What is the waiting period for item 101?", "Is maternity covered?"],
+        }
+        response = httpx.post(f"{base_url}/hackrx/run", json=body, timeout=60.0,
+                              headers={"Authorization": f"Bearer {AUTH_TOKEN}"})
+        response.raise_for_status()
+        result["first_request"] = time.perf_counter() - started
+    finally:
+        stop(process)
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return {name: round(seconds, 3) for name, seconds in result.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=5, help="Pages of the first request's document")
+    parser.add_argument("--backend", default="pinecone", choices=["pinecone", "local"])
+    parser.add_argument("--warm", action="store_true", help="Start the server with WARM_UP_ON_STARTUP=true")
+    parser.add_argument("--profile", help="Latency/error profile JSON for fake_upstreams.py")
+    parser.add_argument("--output", help="Also write the results JSON here")
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstreams = start_fake_upstreams(upstream_port, args.profile, seed=0)
+    try:
+        trials = [trial(args, upstream_port) for _ in range(args.trials)]
+    finally:
+        stop(upstreams)
+
+    report = {
+        "config": {"backend": args.backend, "warm": args.warm, "pages": args.pages, "trials": args.trials},
+        "median": {name: round(statistics.median(t[name] for t in trials), 3) for name in trials[0]},
+        "trials": trials,
+    }
+    print(f"{'step':<16}{'median':>10}   trials")
+    for name, median in report["median"].items():
+        print(f"{name:<16}{median:>9.3f}s   " + "  ".join(f"{t[name]:.3f}" for t in trials))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
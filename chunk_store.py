@@ -0,0 +1,165 @@
+# File: chunk_store.py
+
+import json
+import mmap
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from metrics import log
+
+class ChunkView:
+    """
+    Read-only view of one document's chunks: a memory-mapped UTF-8 blob of
+    every chunk's text back to back, plus byte offsets, ordinals, pages and
+    document character offsets per vector ID. Text is decoded from the mapping on lookup, never loaded whole.
+    """
+
+    def __init__(self, blob_path: str, meta: dict, version: int):
+        self.ids = meta['ids']
+        self.offsets = meta['offsets']  # len(ids) + 1 byte offsets into the blob
+        self.ordinals = meta['ordinals']
+        self.pages = meta['pages']
+        # Character offsets of each chunk in the document; absent in stores written before they were kept
+        self.starts = meta.get('starts')
+        self.ends = meta.get('ends')
+        self.version = version
+        self.positions = {chunk_id: position for position, chunk_id in enumerate(self.ids)}
+        self.by_ordinal = {ordinal: position for position, ordinal in enumerate(self.ordinals)}
+        with open(blob_path, "rb") as f:
+            # mmap refuses empty files
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+
+    def _text(self, position: int) -> str:
+        return str(memoryview(self.blob)[self.offsets[position]:self.offsets[position + 1]], "utf-8")
+
+    def _chunk(self, position: int) -> dict:
+        return {
+            'text': self._text(position), 'chunk': self.ordinals[position], 'page': self.pages[position],
+            'start': self.starts[position] if self.starts is not None else None,
+            'end': self.ends[position] if self.ends is not None else None
+        }
+
+    def chunk(self, chunk_id: str):
+        """{'text', 'chunk', 'page', 'start', 'end'} of the chunk with the given vector ID, or None."""
+        position = self.positions.get(chunk_id)
+        return self._chunk(position) if position is not None else None
+
+    def chunk_at(self, ordinal: int):
+        """The chunk with the given ordinal, as chunk() returns it, or None."""
+        position = self.by_ordinal.get(ordinal)
+        return self._chunk(position) if position is not None else None
+
+class ChunkWriter:
+    """Streams one document's chunks to temporary files during ingestion; ChunkStore.put() publishes them."""
+
+    def __init__(self, path: str, namespace: str):
+        # Each version of a document's blob gets its own file, named in its index
+        self.blob_name = f"{namespace}.{uuid.uuid4().hex[:12]}.chunks"
+        self.temp_path = os.path.join(path, f"{self.blob_name}.tmp")
+        self.file = open(self.temp_path, "wb")
+        self.ids = []
+        self.offsets = [0]
+        self.ordinals = []
+        self.pages = []
+        self.starts = []
+        self.ends = []
+        self.lock = threading.Lock()
+
+    def add(self, chunk_id: str, text: str, ordinal: int, page: int, start: int, end: int):
+        data = text.encode("utf-8")
+        with self.lock:
+            self.file.write(data)
+            self.ids.append(chunk_id)
+            self.offsets.append(self.offsets[-1] + len(data))
+            self.ordinals.append(ordinal)
+            self.pages.append(page)
+            self.starts.append(start)
+            self.ends.append(end)
+
+    def meta(self) -> dict:
+        return {
+            'blob': self.blob_name, 'ids': self.ids, 'offsets': self.offsets,
+            'ordinals': self.ordinals, 'pages': self.pages, 'starts': self.starts, 'ends': self.ends
+        }
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+class ChunkStore:
+    """
+    Chunk text and positions per namespace, kept on local disk so vectors
+    carry only IDs and values: <namespace>.json (IDs, offsets and the name
+    of the blob) and the UTF-8 blob it names. Views are cached per worker
+    and reopened when another worker publishes a new version.
+    """
+
+    def __init__(self, path: str, max_loaded: int = 64):
+        self.path = path
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _meta_path(self, namespace: str) -> str:
+        return os.path.join(self.path, f"{namespace}.json")
+
+    def _read_meta(self, meta_path: str) -> dict:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def writer(self, namespace: str) -> ChunkWriter:
+        os.makedirs(self.path, exist_ok=True)
+        return ChunkWriter(self.path, namespace)
+
+    def put(self, namespace: str, writer: ChunkWriter):
+        """Publishes a finished writer's chunks as the namespace's chunks, replacing any earlier ones."""
+        meta_path = self._meta_path(namespace)
+        try:
+            previous_blob = self._read_meta(meta_path)['blob']
+        except (OSError, ValueError, KeyError):
+            previous_blob = None
+        writer.file.close()
+        os.replace(writer.temp_path, os.path.join(self.path, writer.blob_name))
+        temp_meta = f"{writer.temp_path}.json"
+        with open(temp_meta, "w", encoding="utf-8") as f:
+            json.dump(writer.meta(), f)
+        os.replace(temp_meta, meta_path)
+        if previous_blob and previous_blob != writer.blob_name:
+            # Views that already mapped it keep reading the unlinked file
+            try:
+                os.remove(os.path.join(self.path, previous_blob))
+            except OSError:
+                pass
+        with self.lock:
+            self.loaded.pop(namespace, None)
+
+    def get(self, namespace: str):
+        """Returns the namespace's ChunkView, or None if it was ingested without a chunk store."""
+        meta_path = self._meta_path(namespace)
+        # A second attempt covers a new version published between reading the index and opening its blob
+        for attempt in range(2):
+            try:
+                version = os.stat(meta_path).st_mtime_ns
+            except OSError:
+                return None
+            with self.lock:
+                view = self.loaded.get(namespace)
+                if view is not None and view.version == version:
+                    self.loaded.move_to_end(namespace)
+                    return view
+            try:
+                meta = self._read_meta(meta_path)
+                view = ChunkView(os.path.join(self.path, meta['blob']), meta, version)
+                break
+            except (OSError, ValueError, KeyError) as e:
+                if attempt:
+                    log(f"Warning: Could not load chunk store for {namespace}: {e}")
+                    return None
+        with self.lock:
+            self.loaded[namespace] = view
+            self.loaded.move_to_end(namespace)
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+        return view
@@ -0,0 +1,138 @@
+# File: chunker.py
+
+# Chunking settings shared by every ingestion path
+CHUNK_SIZE = 500     # Smaller chunks for faster processing
+CHUNK_OVERLAP = 50   # Reduced overlap
+SEPARATORS = ("\n\n", "\n", ". ", " ")  # Tried in order, coarsest first
+
+class Chunk:
+    """
+    One chunk of a document. start/end are character offsets into the
+    document's text (its pages joined with "\\n"); page is where it starts.
+    """
+
+    __slots__ = ("doc_hash", "ordinal", "page", "start", "end", "text")
+
+    def __init__(self, doc_hash: str, ordinal: int, page: int, start: int, end: int, text: str):
+        self.doc_hash = doc_hash
+        self.ordinal = ordinal
+        self.page = page
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"Chunk({self.doc_hash!r}, ordinal={self.ordinal}, page={self.page}, span={self.start}:{self.end})"
+
+# --- Recursive splitting over offsets ---
+# Same rules as a recursive character splitter that keeps each separator at
+# the start of the piece after it and strips whitespace from every chunk, but
+# pieces are (start, end) offsets into one string: the only strings created
+# are the finished chunks.
+
+def _strip(text: str, start: int, end: int) -> tuple:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+def _pieces(text: str, start: int, end: int, separator: str) -> list:
+    """Splits text[start:end] before each separator, dropping empty pieces."""
+    pieces = []
+    step = len(separator)
+    position = text.find(separator, start, end)
+    while position != -1:
+        if position > start:
+            pieces.append((start, position))
+        start = position
+        position = text.find(separator, start + step, end)
+    if end > start:
+        pieces.append((start, end))
+    return pieces
+
+def _merge(text: str, pieces: list, spans: list, chunk_size: int, chunk_overlap: int):
+    """Packs consecutive pieces into chunks of at most chunk_size, overlapping by up to chunk_overlap."""
+    window = []  # index of the first piece in the current chunk is `first`
+    first = 0
+    total = 0
+    for piece in pieces:
+        length = piece[1] - piece[0]
+        if total + length > chunk_size and len(window) > first:
+            span = _strip(text, window[first][0], window[-1][1])
+            if span[1] > span[0]:
+                spans.append(span)
+            # Drop pieces from the front until what is left fits as overlap
+            while total > chunk_overlap or (total + length > chunk_size and total > 0):
+                total -= window[first][1] - window[first][0]
+                first += 1
+        window.append(piece)
+        total += length
+    if len(window) > first:
+        span = _strip(text, window[first][0], window[-1][1])
+        if span[1] > span[0]:
+            spans.append(span)
+
+def _split(text: str, start: int, end: int, separators: tuple, chunk_size: int, chunk_overlap: int, spans: list):
+    separator, finer = separators[-1], ()
+    for i, candidate in enumerate(separators):
+        if text.find(candidate, start, end) != -1:
+            separator, finer = candidate, separators[i + 1:]
+            break
+
+    good = []
+    for piece in _pieces(text, start, end, separator):
+        if piece[1] - piece[0] < chunk_size:
+            good.append(piece)
+            continue
+        if good:
+            _merge(text, good, spans, chunk_size, chunk_overlap)
+            good = []
+        if finer:
+            _split(text, piece[0], piece[1], finer, chunk_size, chunk_overlap, spans)
+        else:
+            spans.append(piece)  # No finer separator left; kept whole even if too long
+    if good:
+        _merge(text, good, spans, chunk_size, chunk_overlap)
+
+def split_spans(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                separators: tuple = SEPARATORS) -> list:
+    """Returns the (start, end) offsets of each chunk of text, in order."""
+    spans = []
+    _split(text, 0, len(text), tuple(separators), chunk_size, chunk_overlap, spans)
+    return spans
+
+def split_text(text: str, **settings) -> list:
+    return [text[start:end] for start, end in split_spans(text, **settings)]
+
+# --- Page-by-page chunking ---
+class PageChunker:
+    """
+    Chunks a document as its pages arrive. Each page is split on its own,
+    so chunk boundaries are anchored at page boundaries: editing one page
+    changes only that page's chunks, and every later chunk keeps its text
+    (and with it its content-hash vector ID).
+    """
+
+    def __init__(self, doc_hash: str = None, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 separators: tuple = SEPARATORS):
+        self.doc_hash = doc_hash
+        self.settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "separators": tuple(separators)}
+        self.count = 0    # Chunks emitted so far (the next ordinal)
+        self._origin = 0  # Document offset where the next page starts
+
+    def add_page(self, page_number: int, text: str) -> list:
+        """Splits one page; returns its chunks, possibly none."""
+        chunks = []
+        for start, end in split_spans(text, **self.settings):
+            chunks.append(Chunk(
+                self.doc_hash, self.count, page_number, self._origin + start, self._origin + end, text[start:end]
+            ))
+            self.count += 1
+        # Pages are joined with "\n" in the document's text
+        self._origin += len(text) + 1
+        return chunks
+
+    def finish(self) -> list:
+        """Chunks still pending after the last page; pages are split as they arrive, so none."""
+        return []
@@ -10,9 +10,78 @@ JINA_API_KEY = os.getenv("JINA_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 API_AUTH_TOKEN = os.getenv("API_AUTH_TOKEN", "b3c00e5d9170676e30277fe0ad6d201ffdfd529c4ddb882ad71bf406454178f3")
 
-# --- Pinecone Settings ---
+# --- Vector Store Settings ---
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")  # "pinecone" or "local" (in-process NumPy index)
 PINECONE_INDEX_NAME = "hackrx-jina-index"
+EMBEDDING_DIMENSION = 768  # Dimension for Jina's jina-embeddings-v2-base-en
+
+# --- PDF Extraction ---
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 2)))  # Processes extracting pages
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))  # Pages per extraction task
+
+# --- Embedding Client ---
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "2048"))  # Estimated tokens per embedding call
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "128"))  # Hard cap on texts per call
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))  # Embedding calls in flight at once
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))  # Retries on 429/5xx
+EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "0.5"))  # Base backoff in seconds
+
+# --- Ingestion Pipeline ---
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))  # Max batches waiting between pipeline stages
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))  # Documents ingested at once by POST /documents
+REQUEST_INGEST_WORKERS = int(os.getenv("REQUEST_INGEST_WORKERS", "8"))  # Documents ingested at once for waiting requests
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))  # Finished jobs remembered for GET /documents/{hash}
+
+# --- Hybrid Retrieval ---
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # Fuse BM25 with dense results
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))  # Candidates taken from each ranking before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))  # Reciprocal rank fusion constant
+
+# --- Context Assembly ---
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))  # Hits retrieved per question before assembly
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))  # Estimated tokens of context per question
+CONTEXT_EXPAND_NEIGHBOURS = os.getenv("CONTEXT_EXPAND_NEIGHBOURS", "true").lower() == "true"  # Fill spare budget with adjacent chunks
+
+# --- Answer Cache ---
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))  # Answers kept per worker
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # Cosine similarity for near-duplicate questions
+
+# --- Local Storage ---
+DATA_DIR = os.getenv("DATA_DIR", ".cache")
+LOCAL_INDEX_DIR = os.path.join(DATA_DIR, "vectors")
+LEXICAL_INDEX_DIR = os.path.join(DATA_DIR, "lexical")  # BM25 index per document
+CHUNK_STORE_DIR = os.path.join(DATA_DIR, "chunks")  # Chunk text per document; vectors carry only IDs and values
+CHUNK_MANIFEST_DIR = os.path.join(DATA_DIR, "manifests")  # Vector IDs stored per document, for incremental re-ingestion
+
+DOCUMENT_MANIFEST_PATH = os.path.join(DATA_DIR, "documents.sqlite3")  # Status, source and content of every ingested document
+INGEST_LEASE_PATH = os.path.join(DATA_DIR, "ingest_leases.sqlite3")  # One ingestion per document across workers
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "30"))  # A crashed worker's lease expires after this
+
+# --- Document Downloads ---
+DOWNLOAD_CACHE_DIR = os.path.join(DATA_DIR, "downloads")  # Raw PDFs, revalidated with ETag/Last-Modified
+DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", str(100 * 1024 * 1024)))  # Refuse larger documents
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "10"))
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "20"))  # Pooled connections overall
+DOWNLOAD_PER_HOST_CONCURRENCY = int(os.getenv("DOWNLOAD_PER_HOST_CONCURRENCY", "4"))  # Concurrent downloads per host
+
+# --- Embedding Cache ---
+EMBEDDING_CACHE_PATH = os.path.join(DATA_DIR, "embeddings.sqlite3")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "20000"))  # Vectors kept in the memory tier
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")  # On-disk storage: float16 or float32
 
 # --- Model Settings (Using Groq with LLaMA + Jina embeddings) ---
 LLM_MODEL = "llama-3.1-8b-instant"  # Latest LLaMA model on Groq
-EMBEDDING_MODEL = "jina-embeddings-v2-base-en"  # Jina embedding model (768 dimensions)
\ No newline at end of file
+EMBEDDING_MODEL = "jina-embeddings-v2-base-en"  # Jina embedding model (768 dimensions)
+JINA_API_URL = os.getenv("JINA_API_URL", "https://api.jina.ai/v1/embeddings")  # Overridden by the offline benchmarks
+
+# --- Concurrency Settings ---
+MAX_CONCURRENT_QUESTIONS = int(os.getenv("MAX_CONCURRENT_QUESTIONS", "5"))  # Questions answered in parallel per request
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "4"))  # Questions answered per LLM call (1 disables batching)
+
+# --- Startup ---
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "false").lower() == "true"  # Warm clients in the background at boot
+
+# --- Request Deadline ---
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "27"))  # Default budget per /hackrx/run request
+MAX_REQUEST_DEADLINE_SECONDS = float(os.getenv("MAX_REQUEST_DEADLINE_SECONDS", "120"))  # Cap on client-supplied budgets
+ANSWER_RESERVE_SECONDS = float(os.getenv("ANSWER_RESERVE_SECONDS", "5"))  # Budget kept for questions after ingestion
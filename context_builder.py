@@ -0,0 +1,115 @@
+# File: context_builder.py
+
+import re
+from llm_services import estimate_tokens
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def merge_adjacent(first: str, first_end, second: str, second_start) -> str:
+    """
+    Joins two consecutive chunks of a document. first_end and second_start
+    are their character offsets in the document, so the text the splitter
+    repeated as overlap is cut by position; chunks without offsets, or with
+    whitespace between them, are joined with "\n".
+    """
+    if first_end is None or second_start is None or second_start > first_end:
+        return first + "\n" + second
+    return first + second[first_end - second_start:]
+
+def build_context(hits: list, token_budget: int, neighbour_chunk=None,
+                  near_duplicate_threshold: float = 0.8, label=None) -> list:
+    """
+    Turns ranked retrieval hits into the passages sent to the LLM.
+
+    `hits` are {'text', 'chunk'} dicts, best first, where 'chunk' is the
+    chunk's ordinal in its document (None when unknown) and optional 'start'
+    and 'end' are its character offsets; hits from several documents also
+    carry 'document' (and 'page'). Near-duplicate hits are dropped, the rest
+    are taken in relevance order while they fit `token_budget`, and leftover
+    budget is spent on the chunks right after or before a selected hit
+    (`neighbour_chunk(document, ordinal)` returns them as {'text', 'start',
+    'end'}). Selected chunks of one document with consecutive ordinals are
+    merged into one passage without their shared overlap. With `label`, each
+    passage starts with label(document, page) of its first known page.
+    Passages are returned best first.
+    """
+    selected = {}  # key -> (rank, document, ordinal, page, text, start, end)
+    kept_shingles = []
+    used = 0
+
+    for rank, hit in enumerate(hits):
+        text = hit['text']
+        shingles = _shingles(text)
+        if any(_similarity(shingles, other) >= near_duplicate_threshold for other in kept_shingles):
+            continue
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            continue
+        document, ordinal = hit.get('document'), hit.get('chunk')
+        key = (document, ordinal) if ordinal is not None else f"hit-{rank}"
+        if key in selected:
+            continue
+        selected[key] = (rank, document, ordinal, hit.get('page'), text, hit.get('start'), hit.get('end'))
+        kept_shingles.append(shingles)
+        used += tokens
+
+    # Spend what is left on the neighbours of the best hits
+    if neighbour_chunk is not None:
+        for rank, document, ordinal, *_ in sorted(list(selected.values()), key=lambda e: e[0]):
+            if ordinal is None:
+                continue
+            for neighbour in (ordinal + 1, ordinal - 1):
+                if neighbour < 0 or (document, neighbour) in selected:
+                    continue
+                chunk = neighbour_chunk(document, neighbour)
+                if not chunk or not chunk['text']:
+                    continue
+                tokens = estimate_tokens(chunk['text'])
+                if used + tokens > token_budget:
+                    continue
+                # A neighbour ranks just behind the hit it extends
+                selected[(document, neighbour)] = (
+                    rank + 0.5, document, neighbour, None, chunk['text'], chunk.get('start'), chunk.get('end')
+                )
+                used += tokens
+
+    def labelled(document, page, text: str) -> str:
+        return text if label is None else f"{label(document, page)}\n{text}"
+
+    # Merge runs of consecutive ordinals within a document; each run ranks as its best member
+    passages = []
+    ordered = sorted(
+        (entry for entry in selected.values() if entry[2] is not None),
+        key=lambda e: (str(e[1]), e[2])
+    )
+    run = None  # [rank, document, last ordinal, page, text, end offset]
+    for rank, document, ordinal, page, text, start, end in ordered:
+        if run is not None and document == run[1] and ordinal == run[2] + 1:
+            run[4] = merge_adjacent(run[4], run[5], text, start)
+            run[0] = min(run[0], rank)
+            run[3] = run[3] if run[3] is not None else page
+            run[2] = ordinal
+            run[5] = max(run[5], end) if run[5] is not None and end is not None else None
+        else:
+            if run is not None:
+                passages.append((run[0], labelled(run[1], run[3], run[4])))
+            run = [rank, document, ordinal, page, text, end]
+    if run is not None:
+        passages.append((run[0], labelled(run[1], run[3], run[4])))
+    passages.extend(
+        (rank, labelled(document, page, text))
+        for rank, document, ordinal, page, text, _, _ in selected.values() if ordinal is None
+    )
+
+    return [text for _, text in sorted(passages, key=lambda p: p[0])]
@@ -0,0 +1,48 @@
+# File: deadline.py
+
+import contextvars
+import time
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+class Deadline:
+    """
+    A request's time budget. Created once per request; every stage asks it
+    how long it may still take instead of using its own fixed timeout.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """Seconds left, keeping `reserve` seconds back for later stages; never negative."""
+        return max(self.expires_at - reserve - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float = None, reserve: float = 0.0) -> float:
+        """Timeout for one upstream call: what is left of the budget, at most `cap`."""
+        remaining = self.remaining(reserve)
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:.1f}s exceeded")
+        return remaining if cap is None else min(cap, remaining)
+
+# The deadline of the request being served; copied into worker threads
+# by asyncio.to_thread, run_pipeline and the Jina pool like the request ID
+current = contextvars.ContextVar("deadline", default=None)
+
+def upstream_timeout(cap: float) -> float:
+    """Timeout for an upstream call: `cap`, shortened to the current request's remaining budget."""
+    deadline = current.get()
+    return cap if deadline is None else deadline.timeout(cap)
+
+def remaining(default: float = float("inf")) -> float:
+    deadline = current.get()
+    return default if deadline is None else deadline.remaining()
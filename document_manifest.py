@@ -0,0 +1,141 @@
+# File: document_manifest.py
+
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+from metrics import log
+
+class DocumentRecord(NamedTuple):
+    doc_hash: str
+    url: str
+    namespace: str  # Where its vectors live: its own hash, or the document it shares content with
+    content_hash: Optional[str]
+    etag: Optional[str]
+    embedding_model: Optional[str]
+    chunk_count: int
+    ingested_at: Optional[float]  # When it last became ready
+    status: str  # "ingesting", "ready", "empty", "failed" or "stale"
+    error: Optional[str]
+
+class DocumentManifest:
+    """
+    Durable record of the documents ingested by every worker sharing `path`,
+    one row per document hash. A document is ready only once its vectors,
+    chunk store and BM25 index are all published; a row left "ingesting" or
+    "failed" marks an ingestion that did not finish. The IDs of vectors
+    upserted by an unfinished ingestion are journaled, so the next attempt
+    skips re-embedding them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One shared connection; WAL lets several workers read while one writes
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS documents (doc_hash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "namespace TEXT NOT NULL, content_hash TEXT, etag TEXT, embedding_model TEXT, "
+            "chunk_count INTEGER NOT NULL DEFAULT 0, ingested_at REAL, status TEXT NOT NULL, error TEXT)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS documents_content ON documents (content_hash, status)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pending_vectors (doc_hash TEXT NOT NULL, id TEXT NOT NULL, "
+            "PRIMARY KEY (doc_hash, id)) WITHOUT ROWID"
+        )
+        self.db.commit()
+
+    def _write(self, statements: list):
+        with self.lock:
+            try:
+                for sql, params in statements:
+                    if isinstance(params, list):
+                        self.db.executemany(sql, params)
+                    else:
+                        self.db.execute(sql, params)
+                self.db.commit()
+            except BaseException:
+                self.db.rollback()
+                raise
+
+    def get(self, doc_hash: str) -> Optional[DocumentRecord]:
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT {', '.join(DocumentRecord._fields)} FROM documents WHERE doc_hash = ?", (doc_hash,)
+            ).fetchone()
+        return DocumentRecord(*row) if row is not None else None
+
+    def find_content(self, content_hash: str, embedding_model: str, exclude: str = None) -> Optional[DocumentRecord]:
+        """A ready document stored in its own namespace with this content and embedding model, if any."""
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT {', '.join(DocumentRecord._fields)} FROM documents WHERE content_hash = ? "
+                "AND status = 'ready' AND embedding_model = ? AND namespace = doc_hash AND doc_hash != ? LIMIT 1",
+                (content_hash, embedding_model, exclude or "")
+            ).fetchone()
+        return DocumentRecord(*row) if row is not None else None
+
+    def start(self, doc_hash: str, url: str, content_hash: str, etag: Optional[str], embedding_model: str):
+        """
+        Marks an ingestion into the document's own namespace as under way. A
+        ready (or empty) document keeps its status while it is refreshed: its
+        published version keeps answering until finish() replaces it.
+        """
+        self._write([(
+            "INSERT INTO documents (doc_hash, url, namespace, content_hash, etag, embedding_model, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'ingesting') ON CONFLICT(doc_hash) DO UPDATE SET url = excluded.url, "
+            "content_hash = excluded.content_hash, etag = excluded.etag, "
+            "embedding_model = excluded.embedding_model, status = 'ingesting', error = NULL "
+            "WHERE documents.status NOT IN ('ready', 'empty') "
+            "OR documents.embedding_model IS NOT excluded.embedding_model",
+            (doc_hash, url, doc_hash, content_hash, etag, embedding_model)
+        )])
+
+    def add_vectors(self, doc_hash: str, ids: list):
+        """Journals vector IDs upserted by the document's ingestion in progress."""
+        self._write([(
+            "INSERT OR IGNORE INTO pending_vectors (doc_hash, id) VALUES (?, ?)",
+            [(doc_hash, vector_id) for vector_id in ids]
+        )])
+
+    def pending_vectors(self, doc_hash: str) -> list:
+        """IDs of vectors stored by ingestions of the document that never finished."""
+        with self.lock:
+            rows = self.db.execute("SELECT id FROM pending_vectors WHERE doc_hash = ?", (doc_hash,)).fetchall()
+        return [row[0] for row in rows]
+
+    def finish(self, doc_hash: str, url: str, namespace: str, content_hash: str, etag: Optional[str],
+               embedding_model: str, chunk_count: int, status: str = "ready"):
+        """Records a finished ingestion (or a revalidation) and clears its journal."""
+        statements = [
+            (
+                "INSERT OR REPLACE INTO documents (doc_hash, url, namespace, content_hash, etag, embedding_model, "
+                "chunk_count, ingested_at, status, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                (doc_hash, url, namespace, content_hash, etag, embedding_model, chunk_count, time.time(), status)
+            ),
+            ("DELETE FROM pending_vectors WHERE doc_hash = ?", (doc_hash,)),
+        ]
+        if namespace == doc_hash:
+            # Documents sharing this namespace for other content must be ingested again
+            statements.append((
+                "UPDATE documents SET status = 'stale' WHERE namespace = ? AND doc_hash != ? "
+                "AND content_hash IS NOT ? AND status = 'ready'",
+                (namespace, doc_hash, content_hash)
+            ))
+        self._write(statements)
+
+    def fail(self, doc_hash: str, error: str):
+        """
+        Marks the document's ingestion as failed; its journal is kept for the
+        retry. A failed refresh leaves the published version ready.
+        """
+        try:
+            self._write([(
+                "UPDATE documents SET status = CASE WHEN status IN ('ready', 'empty') THEN status ELSE 'failed' END, "
+                "error = ? WHERE doc_hash = ?", (error, doc_hash)
+            )])
+        except sqlite3.Error as e:
+            log(f"Could not record failed ingestion of {doc_hash}: {e}")
@@ -1,68 +1,134 @@
 # File: document_processor.py
 
-import requests
-import io
-from pypdf import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document
+import httpx
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from config import PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK
+from downloader import download
+from metrics import StageTimer, log
+from chunker import PageChunker
+
+# pypdf is imported on first use, not at import time, so the server (and
+# every spawned extraction worker) starts without loading it
+
+# --- Parallel Page Extraction ---
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    """Lazily creates the shared process pool used for CPU-bound page extraction."""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            # spawn, not fork: forking a threaded server process can deadlock the child
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _extract_pool
+
+def shutdown_extract_pool():
+    """Stops the extraction processes (on server shutdown) so none outlive the server."""
+    global _extract_pool
+    with _extract_pool_lock:
+        pool, _extract_pool = _extract_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> list:
+    """Extracts pages [start, end) of a PDF on disk. Runs inside a pool worker."""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    return [(page_num + 1, reader.pages[page_num].extract_text() or "") for page_num in range(start, end)]
+
+def extract_pdf_pages(pdf_path: str):
+    """
+    Yields (page_number, text) for every page of a PDF on disk, in page order.
+    Large documents are split into page ranges extracted in parallel by the
+    process pool; workers open the file themselves, so no bytes are pickled.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    page_count = len(reader.pages)
+    if page_count <= PDF_PAGES_PER_TASK:
+        # Not worth the round trip to the pool
+        for page_num in range(page_count):
+            yield page_num + 1, reader.pages[page_num].extract_text() or ""
+        return
+
+    starts = range(0, page_count, PDF_PAGES_PER_TASK)
+    ends = [min(start + PDF_PAGES_PER_TASK, page_count) for start in starts]
+    log(f"Extracting {page_count} pages in {len(ends)} ranges across {PDF_EXTRACT_WORKERS} processes")
+    # map() yields results in submission order, so pages come back in order
+    for pages in _get_extract_pool().map(_extract_page_range, [pdf_path] * len(ends), starts, ends):
+        yield from pages
+
+def _warm_extract_worker(_) -> bool:
+    from pypdf import PdfReader  # noqa: F401 - loaded so the first document does not pay for it
+    return True
+
+def warm_up():
+    """Spawns the extraction processes and loads the PDF library ahead of the first document."""
+    # Spawned workers start on the first submission; one task each gets them all importing pypdf
+    list(_get_extract_pool().map(_warm_extract_worker, range(PDF_EXTRACT_WORKERS)))
+
+def iter_pdf_pages(pdf_path: str):
+    """Yields (page_number, text) for each non-empty page as soon as it is extracted."""
+    for page_number, page_text in extract_pdf_pages(pdf_path):
+        if page_text:
+            yield page_number, page_text
+
+def iter_document_chunks(url: str, pdf_path: str = None, doc_hash: str = None):
+    """
+    Yields Chunk records (see chunker.py) while pages are still being
+    extracted; each records the page it starts on and its character offsets.
+    The PDF is downloaded first unless pdf_path points at an already
+    downloaded copy.
+    """
+    log(f"Processing document from URL: {url}")
+    chunker = PageChunker(doc_hash)
+    # Extraction and splitting interleave; each is recorded as one span per document
+    extract_timer = StageTimer("extract")
+    chunk_timer = StageTimer("chunk")
+    outcome = "cancelled"  # Until the last chunk is yielded
+
+    try:
+        if pdf_path is None:
+            pdf_path = download(url).path
+
+        for page_number, page_text in extract_timer.iterate(iter_pdf_pages(pdf_path)):
+            with chunk_timer:
+                chunks = chunker.add_page(page_number, page_text)
+            yield from chunks
+
+        # Flush whatever is left after the last page
+        with chunk_timer:
+            chunks = chunker.finish()
+        yield from chunks
+        outcome = "ok"
+        log(f"Document split into {chunker.count} chunks.")
+
+    except httpx.HTTPError as e:
+        outcome = "error"
+        log(f"Error downloading document from {url}: {e}")
+        raise
+    except Exception as e:
+        outcome = "error"
+        log(f"Unexpected error processing document from {url}: {e}")
+        raise
+    finally:
+        extract_timer.record(outcome)
+        chunk_timer.record(outcome)
 
 def process_documents(urls: list):
     """
-    Downloads PDFs from URLs, extracts text, and returns Document objects.
+    Downloads PDFs from URLs, extracts text, and returns Chunk records.
     Optimized for speed.
     """
     all_documents = []
-    
     for url in urls:
-        print(f"Processing document from URL: {url}")
-        try:
-            # 1. Download the PDF content with aggressive timeout
-            response = requests.get(url, timeout=10)  # Reduced timeout
-            response.raise_for_status()
-            print("Document downloaded successfully.")
-
-            # 2. Read the PDF from the in-memory content
-            pdf_file = io.BytesIO(response.content)
-            reader = PdfReader(pdf_file)
-            
-            full_text = ""
-            # Limit pages for speed (first 20 pages only in emergency)
-            max_pages = min(len(reader.pages), 50)  # Limit for speed
-            for page_num in range(max_pages):
-                page_text = reader.pages[page_num].extract_text()
-                if page_text:
-                    full_text += page_text + "\n"
-            
-            if max_pages < len(reader.pages):
-                print(f"Warning: Processing only first {max_pages} pages for speed optimization")
-            
-            print("Text extracted from PDF pages.")
-
-            # 3. Chunk the extracted text aggressively for speed
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=500,   # Smaller chunks for faster processing
-                chunk_overlap=50,  # Reduced overlap
-                length_function=len,
-                separators=["\n\n", "\n", ". ", " "]  # Simplified separators
-            )
-            chunks = text_splitter.split_text(full_text)
-            print(f"Document split into {len(chunks)} chunks.")
-
-            # Convert to Document objects
-            for i, chunk in enumerate(chunks):
-                doc = Document(
-                    page_content=chunk,
-                    metadata={"source": url, "chunk": i}
-                )
-                all_documents.append(doc)
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error downloading document from {url}: {e}")
-            raise
-        except Exception as e:
-            print(f"Unexpected error processing document from {url}: {e}")
-            raise
-    
+        all_documents.extend(iter_document_chunks(url))
     return all_documents
 
 # Keep the original function for backward compatibility but optimize it
@@ -72,7 +138,7 @@ def process_document_from_url(url: str):
     """
     documents = process_documents([url])
     # Convert back to text chunks for legacy compatibility
-    chunks = [doc.page_content for doc in documents]
+    chunks = [chunk.text for chunk in documents]
     
     # Use the optimized vector store function
     from vector_store import process_and_store_documents
@@ -0,0 +1,149 @@
+# File: downloader.py
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+import httpx
+from config import (
+    DOWNLOAD_CACHE_DIR, DOWNLOAD_MAX_BYTES, DOWNLOAD_TIMEOUT,
+    DOWNLOAD_MAX_CONNECTIONS, DOWNLOAD_PER_HOST_CONCURRENCY
+)
+from metrics import log
+
+class DownloadResult(NamedTuple):
+    url: str
+    path: str  # Raw PDF in the download cache
+    content_hash: str  # sha256 of the bytes, shared by every URL serving the same file
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+    from_cache: bool  # True when the server answered 304 Not Modified
+
+class DownloadTooLarge(Exception):
+    pass
+
+# --- Event loop owning the pooled client ---
+# The async client and its connection pool live on one background loop, so
+# both sync callers (ingestion threads) and async callers share keep-alive connections.
+_loop = None
+_client = None
+_host_slots = {}
+_loop_lock = threading.Lock()
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="downloader", daemon=True).start()
+        return _loop
+
+def start_client_loop():
+    """Starts the background loop and its pooled client ahead of the first download."""
+    asyncio.run_coroutine_threadsafe(_start_client(), _get_loop()).result()
+
+async def _start_client():
+    _get_client()
+
+def _get_client() -> httpx.AsyncClient:
+    """Runs on the downloader loop."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(DOWNLOAD_TIMEOUT),
+            limits=httpx.Limits(max_connections=DOWNLOAD_MAX_CONNECTIONS, max_keepalive_connections=DOWNLOAD_MAX_CONNECTIONS),
+            follow_redirects=True
+        )
+    return _client
+
+def _host_slot(url: str) -> asyncio.Semaphore:
+    """Runs on the downloader loop."""
+    host = urlsplit(url).netloc
+    if host not in _host_slots:
+        _host_slots[host] = asyncio.Semaphore(DOWNLOAD_PER_HOST_CONCURRENCY)
+    return _host_slots[host]
+
+# --- Raw PDF cache ---
+def _cache_paths(url: str):
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return os.path.join(DOWNLOAD_CACHE_DIR, f"{key}.pdf"), os.path.join(DOWNLOAD_CACHE_DIR, f"{key}.json")
+
+def cached_download(url: str) -> Optional[DownloadResult]:
+    """Returns the cached copy of a URL without touching the network, if there is one."""
+    pdf_path, meta_path = _cache_paths(url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(pdf_path):
+        return None
+    return DownloadResult(
+        url=url, path=pdf_path, content_hash=meta['content_hash'], size=meta['size'],
+        etag=meta.get('etag'), last_modified=meta.get('last_modified'), from_cache=True
+    )
+
+async def _fetch(url: str) -> DownloadResult:
+    """Runs on the downloader loop: conditional GET, streamed to disk with a size guard."""
+    os.makedirs(DOWNLOAD_CACHE_DIR, exist_ok=True)
+    pdf_path, meta_path = _cache_paths(url)
+    cached = cached_download(url)
+
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
+    async with _host_slot(url):
+        async with _get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached is not None:
+                log("Document not modified since last download, using cached copy.")
+                return cached
+            response.raise_for_status()
+
+            declared = int(response.headers.get('Content-Length') or 0)
+            if declared > DOWNLOAD_MAX_BYTES:
+                raise DownloadTooLarge(f"Document is {declared} bytes, limit is {DOWNLOAD_MAX_BYTES}")
+
+            hasher = hashlib.sha256()
+            size = 0
+            temp_path = f"{pdf_path}.{uuid.uuid4().hex}.part"
+            try:
+                with open(temp_path, "wb") as f:
+                    async for block in response.aiter_bytes():
+                        size += len(block)
+                        if size > DOWNLOAD_MAX_BYTES:
+                            raise DownloadTooLarge(f"Document exceeds the {DOWNLOAD_MAX_BYTES} byte limit")
+                        hasher.update(block)
+                        f.write(block)
+                os.replace(temp_path, pdf_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            result = DownloadResult(
+                url=url, path=pdf_path, content_hash=hasher.hexdigest(), size=size,
+                etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'),
+                from_cache=False
+            )
+
+    temp_meta_path = f"{meta_path}.{uuid.uuid4().hex}.part"
+    with open(temp_meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            'url': url, 'content_hash': result.content_hash, 'size': result.size,
+            'etag': result.etag, 'last_modified': result.last_modified
+        }, f)
+    os.replace(temp_meta_path, meta_path)
+    log(f"Document downloaded successfully ({size} bytes).")
+    return result
+
+def download(url: str) -> DownloadResult:
+    """Downloads (or revalidates) a document from a worker thread."""
+    return asyncio.run_coroutine_threadsafe(_fetch(url), _get_loop()).result()
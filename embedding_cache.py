@@ -0,0 +1,103 @@
+# File: embedding_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from metrics import log
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with two tiers:
+    a bounded in-memory LRU and a sqlite file storing compact float16/float32 blobs.
+    Keys are (model, sha256 of the text), so identical text is embedded once per model.
+    """
+
+    def __init__(self, path: str, max_memory_items: int = 20000, dtype: str = "float16"):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.dtype = np.dtype(dtype)
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One shared connection; WAL lets several workers read while one writes
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dtype TEXT NOT NULL, data BLOB NOT NULL)"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def get_many(self, keys: list) -> dict:
+        """Returns {key: float32 vector} for every key found in either tier."""
+        found = {}
+        with self.lock:
+            for key in keys:
+                vector = self.memory.get(key)
+                if vector is not None:
+                    self.memory.move_to_end(key)
+                    found[key] = vector
+            memory_found = len(found)
+
+            wanted = [key for key in dict.fromkeys(keys) if key not in found]
+            # sqlite caps the number of bound parameters, so look up in slices
+            for i in range(0, len(wanted), 500):
+                part = wanted[i:i + 500]
+                rows = self.db.execute(
+                    f"SELECT key, dtype, data FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                    part
+                ).fetchall()
+                for key, dtype, data in rows:
+                    vector = np.frombuffer(data, dtype=dtype).astype(np.float32)
+                    self._remember(key, vector)
+                    found[key] = vector
+
+            self.memory_hits += memory_found
+            self.disk_hits += len(found) - memory_found
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: dict):
+        """Stores {key: vector} in both tiers."""
+        if not items:
+            return
+        rows = []
+        with self.lock:
+            for key, values in items.items():
+                vector = np.asarray(values, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, self.dtype.name, vector.astype(self.dtype).tobytes()))
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO embeddings (key, dtype, data) VALUES (?, ?, ?)", rows)
+                self.db.commit()
+            except sqlite3.Error as e:
+                # The memory tier still works; a busy or read-only disk must not fail ingestion
+                log(f"Warning: Could not persist embeddings to cache: {e}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_items': len(self.memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,141 @@
+# File: ingest_jobs.py
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import INGEST_WORKERS, INGEST_JOB_HISTORY, REQUEST_INGEST_WORKERS
+from vector_store import process_and_store_documents, published_result, get_document_hash
+from metrics import log
+import deadline
+
+class IngestJob:
+    """One ingestion of one document. `future` resolves to process_and_store_documents' result."""
+
+    def __init__(self, url: str, refresh: bool = False):
+        self.url = url
+        self.refresh = refresh
+        self.doc_hash = get_document_hash(url)
+        self.state = "queued"  # queued -> running -> done | failed
+        self.error = None
+        self.result = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = Future()
+
+    def to_dict(self) -> dict:
+        return {
+            'doc_hash': self.doc_hash,
+            'url': self.url,
+            'state': self.state,
+            'status': self.result['status'] if self.result else None,
+            'chunks': self.result['chunks'] if self.result else None,
+            'changes': {key: self.result[key] for key in ('added', 'kept', 'removed')} if self.result else None,
+            'error': self.error,
+            'queued_seconds': round((self.started_at or time.time()) - self.submitted_at, 3),
+            'timings': self.result['timings'] if self.result else {},
+        }
+
+# --- Job registry ---
+_jobs = OrderedDict()  # doc_hash -> latest IngestJob
+_lock = threading.Lock()
+# Background ingestion never takes more than INGEST_WORKERS threads
+_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+# Ingestion a request waits on gets its own threads: on the default executor it would
+# starve the asyncio.to_thread calls (embedding, retrieval, generation) of warm requests
+_request_pool = ThreadPoolExecutor(max_workers=REQUEST_INGEST_WORKERS, thread_name_prefix="ingest-request")
+
+def _claim(job: IngestJob) -> bool:
+    """Moves a queued job to running; False if someone else already started it."""
+    with _lock:
+        if job.state != "queued":
+            return False
+        job.state = "running"
+        job.started_at = time.time()
+        return True
+
+def _run(job: IngestJob):
+    if not _claim(job):
+        return
+    # Shared work: not bound by the deadline of whichever request started it
+    deadline.current.set(None)
+    try:
+        job.result = process_and_store_documents(job.url, job.refresh)
+        job.state = "done"
+        job.future.set_result(job.result)
+    except BaseException as e:
+        job.error = str(e)
+        job.state = "failed"
+        job.future.set_exception(e)
+        log(f"Ingestion of {job.url} failed: {e}")
+    finally:
+        job.finished_at = time.time()
+
+def _register(url: str, refresh: bool = False):
+    """Returns (job, created): the in-flight job for the URL's document, or a newly registered queued one."""
+    doc_hash = get_document_hash(url)
+    with _lock:
+        job = _jobs.get(doc_hash)
+        if job is not None and job.state in ("queued", "running"):
+            return job, False
+        job = IngestJob(url, refresh)
+        _jobs[doc_hash] = job
+        _jobs.move_to_end(doc_hash)
+        # Forget the oldest finished jobs beyond the history limit
+        for old_hash in list(_jobs.keys())[:max(len(_jobs) - INGEST_JOB_HISTORY, 0)]:
+            if _jobs[old_hash].state in ("done", "failed"):
+                del _jobs[old_hash]
+        return job, True
+
+def _published_job(url: str, result: dict) -> IngestJob:
+    """A finished, unregistered job standing for a document ingested by another worker or before a restart."""
+    job = IngestJob(url)
+    job.state = "done"
+    job.result = result
+    job.started_at = job.finished_at = job.submitted_at
+    job.future.set_result(result)
+    return job
+
+def submit(url: str, refresh: bool = False) -> IngestJob:
+    """
+    Queues background ingestion of a document on the bounded worker pool.
+    With refresh, an already ingested document is checked for changes and updated.
+    Without it, a document the manifest marks ready is not queued again: its
+    latest job is returned as it is, so its timings are kept.
+    """
+    if not refresh:
+        published = published_result(url)
+        if published is not None:
+            job = get_job(get_document_hash(url))
+            return job if job is not None else _published_job(url, published)
+    job, created = _register(url, refresh)
+    if created:
+        # The job logs under the ID of the request that submitted it
+        _pool.submit(contextvars.copy_context().run, _run, job)
+    return job
+
+def get_job(doc_hash: str):
+    with _lock:
+        return _jobs.get(doc_hash)
+
+async def ensure_ingested(url: str, timeout: float = None) -> dict:
+    """
+    Makes sure the document is ingested before answering questions about it.
+    A document whose ingestion is published is answered from that version
+    right away, even while a refresh updates it. Otherwise an in-flight job
+    for the same document is awaited instead of starting a second one; a job still waiting in the background queue is started right
+    away on this request's behalf rather than waiting behind other documents.
+    Raises asyncio.TimeoutError after `timeout` seconds; the job itself keeps
+    running, so a later request finds the document ready.
+    """
+    published = await asyncio.to_thread(published_result, url)
+    if published is not None:
+        return published
+    job, _ = _register(url)
+    if job.state == "queued":
+        # Runs outside the bounded pool so a request never waits behind catalogue warming
+        _request_pool.submit(contextvars.copy_context().run, _run, job)
+    return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout)
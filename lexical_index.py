@@ -0,0 +1,191 @@
+# File: lexical_index.py
+
+import json
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from metrics import log
+
+# Keeps section numbers like "4.2" together and splits on everything else
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    Okapi BM25 over one document's chunks, stored as CSR postings:
+    the postings of term t are doc_ids[indptr[t]:indptr[t+1]] with matching
+    term frequencies, so a query scores every chunk with a single bincount.
+    Only vector IDs, ordinals and pages are kept; chunk text lives in the
+    chunk store.
+    """
+
+    def __init__(self, ids: list, ordinals: list, pages: list, vocabulary: dict, indptr, doc_ids, term_freqs,
+                 doc_lengths, k1: float = 1.2, b: float = 0.75):
+        self.ids = ids
+        self.ordinals = ordinals
+        self.pages = pages
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+
+        count = len(ids)
+        document_freqs = np.diff(indptr).astype(np.float32)
+        self.idf = np.log1p((count - document_freqs + 0.5) / (document_freqs + 0.5)).astype(np.float32)
+        average_length = float(doc_lengths.mean()) if count else 0.0
+        # Per-chunk length normalisation, precomputed once
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / max(average_length, 1e-9))).astype(np.float32)
+        self.k1 = k1
+
+    def search(self, query: str, top_k: int) -> list:
+        """Returns up to top_k (chunk index, score) pairs with a positive score, best first."""
+        term_ids = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not term_ids or not self.ids:
+            return []
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        tfs = np.concatenate([self.term_freqs[s] for s in slices])
+        idf = np.concatenate([np.full(s.stop - s.start, self.idf[t], dtype=np.float32) for t, s in zip(term_ids, slices)])
+
+        weights = idf * tfs * (self.k1 + 1) / (tfs + self.length_norm[docs])
+        scores = np.bincount(docs, weights=weights, minlength=len(self.ids))
+
+        k = min(top_k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path: str):
+        """Writes <path>.npz (postings) and <path>.json (vocabulary, IDs, ordinals and pages)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(
+            path + ".tmp.npz", indptr=self.indptr, doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs, doc_lengths=self.doc_lengths
+        )
+        with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({'ids': self.ids, 'ordinals': self.ordinals, 'pages': self.pages, 'vocabulary': self.vocabulary}, f)
+        os.replace(path + ".tmp.npz", path + ".npz")
+        os.replace(path + ".json.tmp", path + ".json")
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if 'chunks' in meta:
+            # Written before chunk text moved to the chunk store; the text is not kept
+            meta['ordinals'] = [chunk['chunk'] for chunk in meta['chunks']]
+            meta['pages'] = [chunk['page'] for chunk in meta['chunks']]
+        arrays = np.load(path + ".npz")
+        return cls(
+            meta['ids'], meta['ordinals'], meta['pages'], meta['vocabulary'],
+            arrays['indptr'], arrays['doc_ids'], arrays['term_freqs'], arrays['doc_lengths']
+        )
+
+class BM25Builder:
+    """Collects chunks' term counts during ingestion; build() turns them into a BM25Index."""
+
+    def __init__(self):
+        self.ids = []
+        self.ordinals = []
+        self.pages = []
+        self.counts = []
+        self.lock = threading.Lock()
+
+    def add(self, chunk_id: str, text: str, chunk: int, page: int):
+        counts = Counter(tokenize(text))
+        with self.lock:
+            self.ids.append(chunk_id)
+            self.ordinals.append(chunk)
+            self.pages.append(page)
+            self.counts.append(counts)
+
+    def build(self) -> BM25Index:
+        vocabulary = {}
+        postings = []  # per term: list of (doc, tf)
+        for doc, counts in enumerate(self.counts):
+            for term, tf in counts.items():
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc, tf))
+
+        indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(p) for p in postings])
+        doc_ids = np.fromiter((doc for p in postings for doc, _ in p), dtype=np.int32, count=int(indptr[-1]))
+        term_freqs = np.fromiter((tf for p in postings for _, tf in p), dtype=np.float32, count=int(indptr[-1]))
+        doc_lengths = np.array([sum(c.values()) for c in self.counts], dtype=np.float32)
+        return BM25Index(self.ids, self.ordinals, self.pages, vocabulary, indptr, doc_ids, term_freqs, doc_lengths)
+
+def reciprocal_rank_scores(rankings: list, k: int = 60) -> dict:
+    """Scores each ID of several ranked lists by the sum of 1 / (k + rank) over the lists."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return scores
+
+# --- Loaded indexes, one per namespace ---
+class LexicalIndexStore:
+    """
+    Loads BM25 indexes from disk on first use and keeps the most recent ones in
+    memory, reloading one when another worker publishes a new version.
+    """
+
+    def __init__(self, path: str, max_loaded: int = 64):
+        self.path = path
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()  # namespace -> (version, index)
+        self.lock = threading.Lock()
+
+    def _file(self, namespace: str) -> str:
+        return os.path.join(self.path, namespace)
+
+    @staticmethod
+    def _version(path: str) -> tuple:
+        # Every save replaces both files, so their inodes change even within one mtime tick
+        meta, arrays = os.stat(path + ".json"), os.stat(path + ".npz")
+        return meta.st_ino, meta.st_mtime_ns, arrays.st_ino, arrays.st_mtime_ns
+
+    def _keep(self, namespace: str, version: tuple, index: BM25Index):
+        with self.lock:
+            self.loaded[namespace] = (version, index)
+            self.loaded.move_to_end(namespace)
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+
+    def put(self, namespace: str, index: BM25Index):
+        index.save(self._file(namespace))
+        self._keep(namespace, self._version(self._file(namespace)), index)
+
+    def get(self, namespace: str):
+        """Returns the namespace's index, or None if it was ingested without one."""
+        path = self._file(namespace)
+        # A second attempt covers a new version published while the index was being read
+        for attempt in range(2):
+            try:
+                version = self._version(path)
+            except OSError:
+                with self.lock:
+                    self.loaded.pop(namespace, None)
+                return None
+            with self.lock:
+                entry = self.loaded.get(namespace)
+                if entry is not None and entry[0] == version:
+                    self.loaded.move_to_end(namespace)
+                    return entry[1]
+            try:
+                index = BM25Index.load(path)
+                if len(index.doc_lengths) != len(index.ids) or self._version(path) != version:
+                    raise ValueError("index changed while loading")
+                break
+            except Exception as e:
+                if attempt:
+                    log(f"Warning: Could not load lexical index for {namespace}: {e}")
+                    return None
+        self._keep(namespace, version, index)
+        return index
@@ -1,45 +1,160 @@
-from groq import Groq
+import contextvars
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from config import GROQ_API_KEY, JINA_API_KEY, LLM_MODEL, EMBEDDING_MODEL
+from requests.adapters import HTTPAdapter
+from config import (
+    GROQ_API_KEY, JINA_API_KEY, JINA_API_URL, LLM_MODEL, EMBEDDING_MODEL,
+    EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DTYPE,
+    EMBEDDING_BATCH_TOKENS, EMBEDDING_BATCH_MAX_ITEMS, EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES, EMBEDDING_RETRY_BACKOFF
+)
+from embedding_cache import EmbeddingCache
+from metrics import span, log, count_rate_limit, count_llm_usage
+import deadline
 
 # --- Initialize Groq client ---
 
-# Initialize Groq client for LLM
-groq_client = Groq(api_key=GROQ_API_KEY)
+# Created on first use: the SDK is slow to import and nothing needs it before the first question
+groq_client = None
+_groq_lock = threading.Lock()
 
-def get_embeddings_from_jina(texts: list):
-    """Generates embeddings for multiple texts at once using Jina AI."""
-    try:
-        url = 'https://api.jina.ai/v1/embeddings'
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {JINA_API_KEY}'
-        }
-        data = {
-            'input': texts,
-            'model': EMBEDDING_MODEL
-        }
-        
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+def get_groq_client():
+    global groq_client
+    if groq_client is None:
+        with _groq_lock:
+            if groq_client is None:
+                from groq import Groq
+                groq_client = Groq(api_key=GROQ_API_KEY)
+    return groq_client
+
+def _groq():
+    """
+    The Groq client for the current call. Under a request deadline the SDK's
+    own retries are disabled: each attempt already gets the whole remaining
+    budget as its timeout, so retrying would overrun it.
+    """
+    client = get_groq_client()
+    return client if deadline.current.get() is None else client.with_options(max_retries=0)
+
+# --- Embedding cache (memory LRU + sqlite on disk) ---
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DTYPE)
+
+# --- Jina embeddings client ---
+JINA_EMBEDDINGS_URL = JINA_API_URL
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Keep-alive connections reused across calls, one per concurrent request
+_jina_session = requests.Session()
+_jina_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=EMBEDDING_MAX_CONCURRENCY)
+_jina_session.mount("https://", _jina_adapter)
+_jina_session.mount("http://", _jina_adapter)  # Local stand-ins (benchmarks)
+_jina_session.headers.update({
+    'Content-Type': 'application/json',
+    'Authorization': f'Bearer {JINA_API_KEY}'
+})
+# Bounds embedding calls in flight across the whole worker, whoever makes them
+_jina_slots = threading.BoundedSemaphore(EMBEDDING_MAX_CONCURRENCY)
+_jina_pool = ThreadPoolExecutor(max_workers=EMBEDDING_MAX_CONCURRENCY, thread_name_prefix="jina")
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used to pack embedding batches."""
+    return len(text) // 4 + 1
+
+def pack_embedding_batches(texts: list) -> list:
+    """Splits texts into consecutive batches that fit EMBEDDING_BATCH_TOKENS and EMBEDDING_BATCH_MAX_ITEMS."""
+    batches = []
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (batch_tokens + tokens > EMBEDDING_BATCH_TOKENS or len(batch) >= EMBEDDING_BATCH_MAX_ITEMS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _post_embeddings(texts: list):
+    """Sends one batch to Jina AI, retrying 429/5xx responses with jittered exponential backoff."""
+    data = {
+        'input': texts,
+        'model': EMBEDDING_MODEL
+    }
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        with _jina_slots:
+            response = _jina_session.post(JINA_EMBEDDINGS_URL, json=data, timeout=deadline.upstream_timeout(30))
+        count_rate_limit("jina", status_code=response.status_code)
+        if response.status_code in RETRYABLE_STATUS_CODES and attempt < EMBEDDING_MAX_RETRIES:
+            delay = EMBEDDING_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            if delay >= deadline.remaining():
+                # The retry could not finish within the request's budget
+                response.raise_for_status()
+            log(f"Jina returned {response.status_code}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+            continue
         response.raise_for_status()
-        
-        result = response.json()
-        return [item['embedding'] for item in result['data']]
+        return [item['embedding'] for item in response.json()['data']]
+
+def _request_embeddings_from_jina(texts: list):
+    """Calls the Jina AI embeddings API, sending token-packed batches concurrently."""
+    try:
+        batches = pack_embedding_batches(texts)
+        if len(batches) == 1:
+            return _post_embeddings(batches[0])
+        # Each batch runs in a copy of the caller's context: its deadline and request ID apply
+        futures = [
+            _jina_pool.submit(contextvars.copy_context().run, _post_embeddings, batch) for batch in batches
+        ]
+        embeddings = []
+        for future in futures:
+            embeddings.extend(future.result())
+        return embeddings
         
     except Exception as e:
-        print(f"Error generating batch embeddings: {e}")
+        log(f"Error generating batch embeddings: {e}")
         raise
 
+def get_embeddings_from_jina(texts: list):
+    """
+    Generates embeddings for multiple texts, serving repeats from the embedding cache.
+    Only the cache misses are sent to Jina AI; results keep input order.
+    """
+    keys = [EmbeddingCache.key(EMBEDDING_MODEL, text) for text in texts]
+    cached = embedding_cache.get_many(keys)
+
+    # Deduplicate misses so repeated text in one call is embedded once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    if missing:
+        fetched = _request_embeddings_from_jina(list(missing.values()))
+        new_items = dict(zip(missing.keys(), fetched))
+        embedding_cache.put_many(new_items)
+        cached.update(new_items)
+
+    if len(texts) > 1:
+        log(f"Embedding cache: {len(texts) - len(missing)}/{len(texts)} hits")
+    return [
+        cached[key].tolist() if hasattr(cached[key], "tolist") else cached[key]
+        for key in keys
+    ]
+
 def get_embedding(text: str):
     """Generates an embedding for a single text using Jina AI."""
     return get_embeddings_from_jina([text])[0]
 
-def get_answer_from_llm(question: str, context: str):
-    """
-    Uses Groq's LLaMA model to generate an answer based on a question and retrieved context.
-    Optimized for speed while maintaining quality.
-    """
-    system_prompt = """You are an expert insurance analyst. Provide accurate, detailed answers based ONLY on the document context provided.
+# --- Answer generation ---
+SYSTEM_PROMPT = """You are an expert insurance analyst. Provide accurate, detailed answers based ONLY on the document context provided.
 
 Instructions:
 - Extract relevant information directly from the context
@@ -47,27 +162,158 @@ Instructions:
 - If info isn't in the context, state: "Not found in the provided document"
 - Be thorough but concise
 - Focus on key details that answer the question"""
-    
+
+BATCH_FORMAT_PROMPT = """
+
+You will receive numbered context passages and several numbered questions. Answer every question using only its listed passages.
+Respond with JSON only, in exactly this shape:
+{"answers": [{"index": <question number>, "answer": "<answer text>"}]}"""
+
+def _answer_messages(question: str, context: str) -> list:
     user_prompt = f"""Context:
 {context}
 
 Question: {question}
 
 Answer based on the context:"""
-    
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def get_answer_from_llm(question: str, context: str):
+    """
+    Uses Groq's LLaMA model to generate an answer based on a question and retrieved context.
+    Optimized for speed while maintaining quality.
+    """
     try:
-        chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            model=LLM_MODEL,
-            temperature=0.1,
-            max_tokens=600,   # Reduced for speed
-            timeout=8,        # Reduced timeout for faster responses
-        )
+        with span("generate"):
+            chat_completion = _groq().chat.completions.create(
+                messages=_answer_messages(question, context),
+                model=LLM_MODEL,
+                temperature=0.1,
+                max_tokens=600,   # Reduced for speed
+                timeout=deadline.upstream_timeout(8),  # Never past the request deadline
+            )
+        count_llm_usage(getattr(chat_completion, "usage", None))
         
         return chat_completion.choices[0].message.content
     except Exception as e:
-        print(f"Error generating answer from LLM: {e}")
-        raise
\ No newline at end of file
+        count_rate_limit("groq", e)
+        log(f"Error generating answer from LLM: {e}")
+        raise
+
+def stream_answer_from_llm(question: str, context: str):
+    """Same as get_answer_from_llm, but yields the answer text in pieces as Groq generates it."""
+    try:
+        with span("generate_stream"):
+            stream = _groq().chat.completions.create(
+                messages=_answer_messages(question, context),
+                model=LLM_MODEL,
+                temperature=0.1,
+                max_tokens=600,
+                timeout=deadline.upstream_timeout(8),
+                stream=True,
+            )
+            for chunk in stream:
+                # Groq reports usage on the final chunk
+                count_llm_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+    except Exception as e:
+        count_rate_limit("groq", e)
+        log(f"Error streaming answer from LLM: {e}")
+        raise
+
+def _parse_batch_answers(content: str, count: int) -> dict:
+    """Maps question index to answer for every well-formed entry of a batched completion."""
+    try:
+        entries = json.loads(content).get("answers", [])
+    except (ValueError, AttributeError):
+        return {}
+    answers = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        index, answer = entry.get("index"), entry.get("answer")
+        if isinstance(index, int) and 0 <= index < count and isinstance(answer, str) and answer.strip():
+            answers[index] = answer.strip()
+    return answers
+
+def get_answers_from_llm_batch(questions: list, contexts: list):
+    """
+    Answers several questions in one Groq completion.
+    `contexts` holds the retrieved chunk texts of each question; chunks shared
+    between questions are sent once and referenced by number. Questions whose
+    answer is missing or unparseable fall back to get_answer_from_llm; if the
+    request deadline runs out during the fallback, the answers still missing
+    are returned as None. A fallback call that fails leaves its exception in
+    place of the answer, so the other questions keep theirs; after a rate
+    limit the remaining fallbacks are not attempted. Rate limits and
+    transport errors of the batched call itself are raised.
+    """
+    if len(questions) == 1:
+        return [get_answer_from_llm(questions[0], "\n---\n".join(contexts[0]))]
+
+    # Deduplicate chunks across questions, keeping first-seen order
+    passage_numbers = {}
+    for chunks in contexts:
+        for chunk in chunks:
+            passage_numbers.setdefault(chunk, len(passage_numbers) + 1)
+
+    passages = "\n\n".join(f"[{number}] {chunk}" for chunk, number in passage_numbers.items())
+    question_lines = "\n".join(
+        f"{i}. {question} (passages: {', '.join(str(passage_numbers[c]) for c in chunks) or 'none'})"
+        for i, (question, chunks) in enumerate(zip(questions, contexts))
+    )
+    user_prompt = f"""Context passages:
+{passages}
+
+Questions:
+{question_lines}
+
+Answer every question based on its passages:"""
+
+    answers = {}
+    try:
+        with span("generate_batch"):
+            chat_completion = _groq().chat.completions.create(
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT + BATCH_FORMAT_PROMPT},
+                    {"role": "user", "content": user_prompt}
+                ],
+                model=LLM_MODEL,
+                temperature=0.1,
+                max_tokens=min(400 * len(questions), 4000),
+                timeout=deadline.upstream_timeout(15),
+                response_format={"type": "json_object"},
+            )
+        count_llm_usage(getattr(chat_completion, "usage", None))
+        choices = chat_completion.choices
+        answers = _parse_batch_answers(choices[0].message.content if choices else None, len(questions))
+    except Exception as e:
+        count_rate_limit("groq", e)
+        log(f"Error generating batched answers from LLM: {e}")
+        # Only output Groq rejected as invalid JSON (400) is worth retrying per question;
+        # after a 429, a timeout or a transport error, N single calls would only add load
+        if getattr(e, "status_code", None) != 400:
+            raise
+
+    missing = [i for i in range(len(questions)) if i not in answers]
+    if missing:
+        log(f"Batched generation missed {len(missing)}/{len(questions)} answers, falling back to single calls")
+        for position, i in enumerate(missing):
+            try:
+                answers[i] = get_answer_from_llm(questions[i], "\n---\n".join(contexts[i]))
+            except deadline.DeadlineExceeded:
+                # Keep the answers already generated; the rest time out
+                break
+            except Exception as e:
+                answers[i] = e
+                if getattr(e, "status_code", None) == 429:
+                    # More single calls would only add load; the rest fail with the same error
+                    for j in missing[position + 1:]:
+                        answers[j] = e
+                    break
+    return [answers.get(i) for i in range(len(questions))]
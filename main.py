@@ -1,20 +1,70 @@
 # File: main.py
 
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from schemas import RunRequest, RunResponse
-from config import API_AUTH_TOKEN
-from vector_store import query_pinecone, process_and_store_documents
-from llm_services import get_answer_from_llm
+from schemas import RunRequest, RunResponse, StreamRunRequest, DocumentsRequest
+from config import (
+    API_AUTH_TOKEN, MAX_CONCURRENT_QUESTIONS, GENERATION_BATCH_SIZE, RETRIEVAL_TOP_K,
+    REQUEST_DEADLINE_SECONDS, MAX_REQUEST_DEADLINE_SECONDS, ANSWER_RESERVE_SECONDS, WARM_UP_ON_STARTUP
+)
+from vector_store import retrieve_chunks_many, get_documents_key, answer_cache, document_manifest, get_backend
+import ingest_jobs
+import metrics
+from metrics import span, log
+import deadline
+from deadline import Deadline, DeadlineExceeded
+from llm_services import (
+    get_answer_from_llm, get_answers_from_llm_batch, stream_answer_from_llm, get_embeddings_from_jina, embedding_cache,
+    get_groq_client
+)
+import document_processor
+from downloader import start_client_loop
 import asyncio
+import json
+import threading
 import time
+from contextlib import asynccontextmanager
+
+# --- Warm-up ---
+def warm_up():
+    """
+    Does the first-request work ahead of time: connects the vector index,
+    builds the Groq client, starts the download loop and spawns the PDF
+    extraction processes. Returns how long each step took.
+    """
+    steps = [
+        ("vector_index", get_backend),
+        ("groq_client", get_groq_client),
+        ("downloader", start_client_loop),
+        ("pdf_extraction", document_processor.warm_up),
+    ]
+    timings = {}
+    for name, step in steps:
+        started = time.time()
+        step()
+        timings[name] = round(time.time() - started, 3)
+    log(f"Warm-up completed: {timings}")
+    return timings
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing blocks startup; with WARM_UP_ON_STARTUP the warm-up runs beside the first requests
+    if WARM_UP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+    document_processor.shutdown_extract_pool()
 
 # --- App Initialization ---
 app = FastAPI(
     title="HackRx Intelligent Query-Retrieval System",
     description="API for processing documents and answering questions using LLMs.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+app.add_middleware(metrics.RequestMetricsMiddleware)
+metrics.register_cache("embeddings", embedding_cache.stats)
+metrics.register_cache("answers", answer_cache.stats)
 
 # --- Authentication ---
 security = HTTPBearer()
@@ -29,74 +79,215 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         )
     return True
 
+# --- Question Pipeline ---
+QUESTION_TIMEOUT_MESSAGE = "Processing timeout - unable to complete all questions"
+INGEST_TIMEOUT_DETAIL = "Processing timeout - document processing took too long"
+
+def start_deadline(requested_seconds: float = None) -> Deadline:
+    """Creates the request's deadline (client-supplied, capped, or the default) and makes it current."""
+    seconds = min(requested_seconds or REQUEST_DEADLINE_SECONDS, MAX_REQUEST_DEADLINE_SECONDS)
+    request_deadline = Deadline(seconds)
+    deadline.current.set(request_deadline)
+    return request_deadline
+
+def ingest_budget(request_deadline: Deadline) -> float:
+    """Seconds ingestion may take: the rest is kept for the questions (at most a third of short budgets)."""
+    return request_deadline.remaining(min(ANSWER_RESERVE_SECONDS, request_deadline.seconds / 3))
+
+def error_answer(e: Exception) -> str:
+    return f"Error answering question: {str(e)}"
+
+def timed_out(e: Exception) -> bool:
+    """True when a failure is the request running out of time (e.g. an upstream timeout cut to the deadline)."""
+    current = deadline.current.get()
+    return isinstance(e, DeadlineExceeded) or (current is not None and current.expired())
+
+async def prepare_questions(questions: list, urls: list, cache_key: str) -> list:
+    """
+    Embeds all questions in one batched call, checks the answer cache and
+    retrieves chunks for the rest with one batched lookup across every document.
+    Returns (kind, value, embedding) per question: kind is "answer" when the
+    question is already settled (cache hit or error), "timeout" when the
+    deadline ran out, otherwise "chunks" with the retrieved chunk texts.
+    """
+    def failed(e: Exception, count: int) -> list:
+        if timed_out(e):
+            return [("timeout", None, None)] * count
+        return [("answer", error_answer(e), None)] * count
+
+    log(f"Embedding {len(questions)} questions...")
+    try:
+        # a. Embed every question once; each embedding serves both the answer cache and retrieval
+        with span("embed_query"):
+            embeddings = await asyncio.to_thread(get_embeddings_from_jina, questions)
+    except Exception as e:
+        log(f"Embedding questions failed: {e}")
+        return failed(e, len(questions))
+
+    prepared = [None] * len(questions)
+    uncached = []
+    for index, (question, embedding) in enumerate(zip(questions, embeddings)):
+        cached_answer = answer_cache.get(cache_key, question, embedding)
+        if cached_answer is not None:
+            log(f"Question {index+1} answered from cache")
+            prepared[index] = ("answer", cached_answer, embedding)
+        else:
+            uncached.append(index)
+    if not uncached:
+        return prepared
+
+    # b. Retrieve relevant context for the rest, assembled within the context token budget
+    try:
+        contexts = await asyncio.to_thread(
+            retrieve_chunks_many, [questions[i] for i in uncached], urls, RETRIEVAL_TOP_K,
+            [embeddings[i] for i in uncached]
+        )
+    except Exception as e:
+        log(f"Retrieval failed for questions {[i+1 for i in uncached]}: {e}")
+        contexts = None
+        failures = failed(e, len(uncached))
+    for position, index in enumerate(uncached):
+        if contexts is None:
+            prepared[index] = failures[position]
+        else:
+            prepared[index] = ("chunks", contexts[position], embeddings[index])
+    return prepared
+
+def stream_answer(index: int, question: str, chunks: list, on_token) -> str:
+    """Streams one answer, reporting each text piece through on_token(index, delta); returns the full answer."""
+    pieces = []
+    for delta in stream_answer_from_llm(question, "\n---\n".join(chunks)):
+        pieces.append(delta)
+        on_token(index, delta)
+    return "".join(pieces)
+
+async def generate_answers(indices: list, questions: list, chunks: list, embeddings: list,
+                           cache_key: str, semaphore: asyncio.Semaphore, on_answer, on_token=None):
+    """
+    Generates answers for a group of questions in one LLM call and reports each one.
+    With on_token (single-question groups only), the answer is streamed as it is generated.
+    """
+    async with semaphore:
+        generation_start = time.time()
+        try:
+            if len(indices) == 1 and on_token is not None:
+                answers = [await asyncio.to_thread(stream_answer, indices[0], questions[0], chunks[0], on_token)]
+            elif len(indices) == 1:
+                answers = [await asyncio.to_thread(get_answer_from_llm, questions[0], "\n---\n".join(chunks[0]))]
+            else:
+                answers = await asyncio.to_thread(get_answers_from_llm_batch, questions, chunks)
+        except Exception as e:
+            if timed_out(e):
+                # Left unanswered: the endpoint reports them as timed out
+                return
+            log(f"Generation failed for questions {[i+1 for i in indices]}: {e}")
+            for index in indices:
+                on_answer(index, error_answer(e))
+            return
+
+        for index, question, embedding, answer in zip(indices, questions, embeddings, answers):
+            if answer is None:  # Batch fallback ran out of time
+                continue
+            if isinstance(answer, Exception):  # Its fallback call failed; the others stand
+                if not timed_out(answer):
+                    on_answer(index, error_answer(answer))
+                continue
+            answer_cache.put(cache_key, question, embedding, answer)
+            on_answer(index, answer)
+        log(f"Questions {[i+1 for i in indices]} completed in {time.time() - generation_start:.2f} seconds")
+
+async def answer_questions(questions: list, urls: list, on_answer, on_token=None, timings: dict = None):
+    """
+    Answers every question without blocking the event loop, calling on_answer(index, answer)
+    as each one is ready. All questions are embedded and retrieved in one batch; uncached
+    questions are then generated in groups of GENERATION_BATCH_SIZE, concurrently. Passing on_token
+    streams tokens instead, which needs one LLM call per question.
+    Stage durations are recorded into `timings` as they finish.
+    """
+    timings = {} if timings is None else timings
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
+    retrieval_start = time.time()
+    # Taken once, so answers are cached under the document versions they were retrieved from
+    cache_key = await asyncio.to_thread(get_documents_key, urls)
+    prepared = await prepare_questions(questions, urls, cache_key)
+    timings["retrieval"] = round(time.time() - retrieval_start, 3)
+
+    pending = []
+    for index, (kind, value, embedding) in enumerate(prepared):
+        if kind == "answer":
+            on_answer(index, value)
+        elif kind == "chunks":
+            pending.append((index, value, embedding))
+
+    batch_size = 1 if on_token is not None else GENERATION_BATCH_SIZE
+    groups = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    generation_start = time.time()
+    await asyncio.gather(*[
+        generate_answers(
+            [index for index, _, _ in group],
+            [questions[index] for index, _, _ in group],
+            [chunks for _, chunks, _ in group],
+            [embedding for _, _, embedding in group],
+            cache_key, semaphore, on_answer, on_token
+        )
+        for group in groups
+    ])
+    timings["generation"] = round(time.time() - generation_start, 3)
+
+async def ingest_documents(urls: list, budget: float) -> list:
+    """Ingests (or joins the in-flight ingestion of) every document in parallel; returns each one's result."""
+    return await asyncio.gather(*[ingest_jobs.ensure_ingested(url, budget) for url in urls])
+
 # --- API Endpoint ---
 @app.post("/hackrx/run", response_model=RunResponse)
 async def run_submission(request: RunRequest, authorized: bool = Depends(verify_token)):
     """
-    Main endpoint to process a document and answer questions.
-    Optimized for sub-30-second response times.
+    Main endpoint to process one or more documents and answer questions.
+    Everything runs against one deadline (REQUEST_DEADLINE_SECONDS, or the
+    client's deadline_seconds): upstream timeouts are cut to what is left of
+    it, and questions still running when it expires get a timeout answer.
     """
     start_time = time.time()
+    request_deadline = start_deadline(request.deadline_seconds)
     try:
-        print(f"Starting processing at {time.strftime('%H:%M:%S')}")
+        log(f"Starting processing at {time.strftime('%H:%M:%S')}")
         
-        # 1. Process the document from the URL (with aggressive timeout)
-        print("Step 1: Processing document...")
+        # 1. Process the documents, keeping ANSWER_RESERVE_SECONDS for the questions
+        urls = request.document_urls()
+        log(f"Step 1: Processing {len(urls)} document(s)...")
         process_start = time.time()
         
-        # Use our optimized function with caching
-        process_and_store_documents(request.documents)
+        # Use our optimized function with caching; joins an in-flight ingestion of the same document
+        try:
+            await ingest_documents(urls, ingest_budget(request_deadline))
+        except asyncio.TimeoutError:
+            # Ingestion carries on in the background for the next request
+            raise HTTPException(status_code=status.HTTP_408_REQUEST_TIMEOUT, detail=INGEST_TIMEOUT_DETAIL)
         
         process_time = time.time() - process_start
-        print(f"Document processing completed in {process_time:.2f} seconds")
-        
-        # Aggressive timeout check - if document processing took too long, abort
-        elapsed = time.time() - start_time
-        if elapsed > 22:  # Leave 8 seconds for questions
-            raise HTTPException(
-                status_code=status.HTTP_408_REQUEST_TIMEOUT,
-                detail="Processing timeout - document processing took too long"
+        log(f"Document processing completed in {process_time:.2f} seconds")
+
+        # 2. Answer all questions concurrently (bounded by MAX_CONCURRENT_QUESTIONS)
+        log(f"Step 2: Generating answers for {len(request.questions)} questions...")
+        all_answers = [None] * len(request.questions)
+
+        def on_answer(index: int, answer: str):
+            all_answers[index] = answer
+
+        # Whatever is still running at the deadline is cancelled and gets a timeout answer
+        try:
+            await asyncio.wait_for(
+                answer_questions(request.questions, urls, on_answer), request_deadline.remaining()
             )
+        except asyncio.TimeoutError:
+            unanswered = sum(answer is None for answer in all_answers)
+            log(f"Timeout reached with {unanswered} questions still running")
 
-        # 2. Loop through questions and generate answers (with aggressive timeout)
-        print("Step 2: Generating answers...")
-        all_answers = []
-        
-        # Limit to maximum 3 questions for speed (hackathon optimization)
-        questions_to_process = request.questions[:3]
-        if len(request.questions) > 3:
-            print(f"Warning: Processing only first 3 of {len(request.questions)} questions for speed")
-        
-        for i, question in enumerate(questions_to_process):
-            # Check timeout for each question - be very aggressive
-            elapsed = time.time() - start_time
-            if elapsed > 27:  # Only 3 seconds left total
-                print(f"Timeout reached after processing {i} questions")
-                # Return partial results for remaining questions
-                remaining = len(questions_to_process) - i
-                all_answers.extend(["Processing timeout - unable to complete all questions"] * remaining)
-                break
-                
-            print(f"Processing question {i+1}/{len(questions_to_process)}: {question[:50]}...")
-            question_start = time.time()
-            
-            # a. Retrieve relevant context from Pinecone (reduced chunks)
-            context = query_pinecone(question, top_k=3)  # Reduced from 5 to 3 for speed
-            
-            # b. Generate answer using LLM with the context
-            answer = get_answer_from_llm(question, context)
-            all_answers.append(answer)
-            
-            question_time = time.time() - question_start
-            print(f"Question {i+1} completed in {question_time:.2f} seconds")
-        
-        # Add empty answers for any skipped questions beyond 3
-        if len(request.questions) > 3:
-            remaining_count = len(request.questions) - len(all_answers)
-            all_answers.extend(["Question limit exceeded - processing only first 3 questions for speed"] * remaining_count)
+        # Answers stay in input order regardless of completion order
+        all_answers = [QUESTION_TIMEOUT_MESSAGE if answer is None else answer for answer in all_answers]
         
         total_time = time.time() - start_time
-        print(f"Total processing time: {total_time:.2f} seconds")
+        log(f"Total processing time: {total_time:.2f} seconds")
         
         return RunResponse(answers=all_answers)
 
@@ -104,13 +295,153 @@ async def run_submission(request: RunRequest, authorized: bool = Depends(verify_
         raise
     except Exception as e:
         total_time = time.time() - start_time
-        print(f"Error occurred after {total_time:.2f} seconds: {e}")
+        log(f"Error occurred after {total_time:.2f} seconds: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An internal error occurred: {str(e)}"
         )
 
+# --- Streaming Endpoint ---
+@app.post("/hackrx/run/stream")
+async def run_submission_stream(request: StreamRunRequest, authorized: bool = Depends(verify_token)):
+    """
+    Same pipeline as /hackrx/run, streamed as NDJSON events:
+    {"event": "ingested"} once the document is ready, {"event": "answer", "index": i}
+    per answer as soon as it completes (plus {"event": "token"} pieces when
+    stream_tokens is set), and a final {"event": "summary"} with per-stage timings.
+    At the deadline, answers cut off mid-stream are sent as far as they got,
+    marked "partial": true.
+    """
+    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    answered = set()
+    partial_answers = {}  # index -> pieces streamed so far
+    timings = {}
+
+    def emit(event: dict):
+        events.put_nowait(event)
+
+    def on_answer(index: int, answer: str):
+        answered.add(index)
+        emit({"event": "answer", "index": index, "answer": answer})
+
+    def on_token(index: int, delta: str):
+        partial_answers.setdefault(index, []).append(delta)
+        # Called from worker threads while Groq streams
+        loop.call_soon_threadsafe(emit, {"event": "token", "index": index, "delta": delta})
+
+    async def produce():
+        request_deadline = start_deadline(request.deadline_seconds)
+        try:
+            process_start = time.time()
+            urls = request.document_urls()
+            try:
+                ingestions = await ingest_documents(urls, ingest_budget(request_deadline))
+            except asyncio.TimeoutError:
+                emit({"event": "error", "detail": INGEST_TIMEOUT_DETAIL})
+                return
+            timings["ingest"] = round(time.time() - process_start, 3)
+            if len(ingestions) == 1:
+                timings["ingest_stages"] = ingestions[0].get('timings', {})
+                ingest_status = ingestions[0].get('status')
+            else:
+                timings["ingest_stages"] = {url: result.get('timings', {}) for url, result in zip(urls, ingestions)}
+                ingest_status = [result.get('status') for result in ingestions]
+            emit({"event": "ingested", "elapsed": timings["ingest"], "status": ingest_status})
+
+            try:
+                await asyncio.wait_for(
+                    answer_questions(
+                        request.questions, urls, on_answer,
+                        on_token if request.stream_tokens else None, timings
+                    ),
+                    request_deadline.remaining()
+                )
+            except asyncio.TimeoutError:
+                for index in range(len(request.questions)):
+                    if index in answered:
+                        continue
+                    pieces = partial_answers.get(index)
+                    if pieces:
+                        answered.add(index)
+                        emit({"event": "answer", "index": index, "answer": "".join(pieces), "partial": True})
+                    else:
+                        on_answer(index, QUESTION_TIMEOUT_MESSAGE)
+        except Exception as e:
+            log(f"Streaming run failed: {e}")
+            emit({"event": "error", "detail": f"An internal error occurred: {str(e)}"})
+        finally:
+            timings["total"] = round(time.time() - start_time, 3)
+            emit({"event": "summary", "answered": len(answered), "timings": timings})
+            emit(None)
+
+    async def stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+        finally:
+            # Client went away: stop working on its questions
+            producer.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# --- Background Ingestion ---
+@app.post("/documents", status_code=status.HTTP_202_ACCEPTED)
+def submit_documents(request: DocumentsRequest, authorized: bool = Depends(verify_token)):
+    """Queues ingestion of documents on the background worker pool, so later requests find them warm."""
+    jobs = [ingest_jobs.submit(url, refresh=request.refresh) for url in request.documents]
+    return {"jobs": [job.to_dict() for job in jobs]}
+
+@app.get("/documents/{doc_hash}")
+def get_document_status(doc_hash: str, authorized: bool = Depends(verify_token)):
+    """State and stage timings of a document's latest ingestion job."""
+    job = ingest_jobs.get_job(doc_hash)
+    if job is not None:
+        return job.to_dict()
+    # Ingested before this worker started (or by another worker)
+    record = document_manifest.get(doc_hash)
+    if record is not None:
+        states = {"ready": "done", "empty": "done", "ingesting": "running"}
+        return {"doc_hash": doc_hash, "state": states.get(record.status, record.status),
+                "status": "cached", "manifest": record._asdict()}
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown document")
+
 # --- Root Endpoint for Health Check ---
 @app.get("/")
 def read_root():
-    return {"status": "ok", "message": "API is running"}
\ No newline at end of file
+    """Liveness: answers as soon as the process is up, without touching any upstream."""
+    return {"status": "ok", "message": "API is running"}
+
+@app.get("/ready")
+def readiness(warm: bool = False):
+    """
+    Readiness: connects to (and checks) the vector index, 503 until that works.
+    With ?warm=true, also does the rest of the first-request work (see warm_up).
+    """
+    try:
+        if warm:
+            return {"status": "ready", "warm_up": warm_up()}
+        get_backend()
+        return {"status": "ready"}
+    except Exception as e:
+        log(f"Readiness check failed: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "unavailable", "detail": str(e)}
+        )
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latency histograms, request counters and cache hit ratios."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/cache/stats")
+def cache_stats(authorized: bool = Depends(verify_token)):
+    """Hit rates of the caches in this worker."""
+    return {"embeddings": embedding_cache.stats(), "answers": answer_cache.stats()}
@@ -0,0 +1,194 @@
+# File: metrics.py
+
+import asyncio
+import contextvars
+import time
+import uuid
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# --- Metrics ---
+# Buckets span cache hits (milliseconds) up to the whole request budget
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+
+STAGE_SECONDS = Histogram(
+    "hackrx_stage_seconds", "Time spent in one pipeline stage (one span)",
+    ["stage", "outcome"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "hackrx_request_seconds", "End-to-end HTTP request latency",
+    ["route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("hackrx_requests_in_flight", "HTTP requests currently being served")
+UPSTREAM_RATE_LIMITED = Counter(
+    "hackrx_upstream_rate_limited_total", "429 responses received from upstream APIs", ["upstream"]
+)
+LLM_TOKENS = Counter("hackrx_llm_tokens_total", "Tokens reported by the LLM API", ["kind"])
+
+# --- Request context ---
+# Set per HTTP request; copied into threads started with copy_context()
+request_id = contextvars.ContextVar("request_id", default="-")
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+def log(message: str):
+    """print() prefixed with the current request ID, so log lines can be matched to spans."""
+    print(f"[{request_id.get()}] {message}")
+
+def _outcome(error: BaseException) -> str:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    return "error"
+
+def observe(stage: str, seconds: float, outcome: str = "ok"):
+    """Records one finished span, both in the histogram and in the current request's summary."""
+    STAGE_SECONDS.labels(stage, outcome).observe(seconds)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds, outcome))  # list.append is atomic across threads
+
+@contextmanager
+def span(stage: str):
+    """Times the enclosed block as one span of `stage`; the outcome follows any exception raised."""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = _outcome(e)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started, outcome)
+
+class StageTimer:
+    """
+    Accumulates the time of a stage that runs in many short slices
+    interleaved with other work (e.g. extraction inside a generator),
+    recorded as a single span by record().
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.seconds = 0.0
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds += time.perf_counter() - self._started
+        return False
+
+    def iterate(self, iterable):
+        """Yields from iterable, counting only the time spent producing each item."""
+        items = iter(iterable)
+        while True:
+            with self:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+
+    def record(self, outcome: str = "ok"):
+        observe(self.stage, self.seconds, outcome)
+
+def count_rate_limit(upstream: str, error: BaseException = None, status_code: int = None):
+    """Counts a 429 from an upstream, given its status code or the exception its client raised."""
+    if status_code is None:
+        status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        UPSTREAM_RATE_LIMITED.labels(upstream).inc()
+
+def count_llm_usage(usage):
+    """Adds a completion's reported token usage (an OpenAI-style usage object) to the counters."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels("prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels("completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+# --- Cache hit ratios ---
+class _CacheCollector:
+    """Reads cache stats at scrape time instead of counting on every lookup."""
+
+    def __init__(self):
+        self.sources = {}
+
+    def collect(self):
+        ratio = GaugeMetricFamily("hackrx_cache_hit_ratio", "Hit ratio of an in-process cache", labels=["cache"])
+        for name, stats in list(self.sources.items()):
+            ratio.add_metric([name], stats().get('hit_rate', 0.0))
+        yield ratio
+
+_caches = _CacheCollector()
+REGISTRY.register(_caches)
+
+def register_cache(name: str, stats):
+    """Exports the 'hit_rate' of stats() as hackrx_cache_hit_ratio{cache=name}."""
+    _caches.sources[name] = stats
+
+def render() -> tuple:
+    """Returns (body, content type) for the /metrics endpoint."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+# --- ASGI middleware ---
+def _summary(spans: list) -> str:
+    totals = {}
+    for stage, seconds, outcome in spans:
+        count, total, failed = totals.get(stage, (0, 0.0, 0))
+        totals[stage] = (count + 1, total + seconds, failed + (outcome != "ok"))
+    parts = []
+    for stage, (count, total, failed) in totals.items():
+        part = f"{stage} {total:.3f}s" + (f"/{count}" if count > 1 else "")
+        parts.append(part + (f" ({failed} failed)" if failed else ""))
+    return ", ".join(parts)
+
+class RequestMetricsMiddleware:
+    """
+    Gives every HTTP request an ID (the client's X-Request-ID or a new one),
+    echoes it in the response, tracks in-flight requests and latency per
+    route, and logs one line per request with its spans summed by stage.
+    Streaming responses are timed until their last body chunk is sent.
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        rid = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:12]
+        rid_token = request_id.set(rid)
+        spans = []
+        spans_token = _request_spans.set(spans)
+        status_code = 500
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            seconds = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            # Route template, not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(route, str(status_code)).observe(seconds)
+            if spans:
+                log(f"{scope['method']} {scope['path']} {status_code} in {seconds:.3f}s: {_summary(spans)}")
+            request_id.reset(rid_token)
+            _request_spans.reset(spans_token)
@@ -0,0 +1,139 @@
+# File: pipeline.py
+
+import contextvars
+import queue
+import threading
+import time
+
+# Marks the end of a stage's input
+_DONE = object()
+
+def batched(items, batch_size: int, weight=None, max_weight: int = None):
+    """
+    Groups an iterable into lists of at most batch_size items, yielding each as soon as it is full.
+    With `weight` and `max_weight`, a batch is also closed before its total weight would exceed max_weight.
+    """
+    batch, batch_weight = [], 0
+    for item in items:
+        item_weight = weight(item) if weight else 0
+        if batch and max_weight is not None and batch_weight + item_weight > max_weight:
+            yield batch
+            batch, batch_weight = [], 0
+        batch.append(item)
+        batch_weight += item_weight
+        if len(batch) >= batch_size:
+            yield batch
+            batch, batch_weight = [], 0
+    if batch:
+        yield batch
+
+def run_pipeline(source, stages: list, queue_size: int = 4, source_name: str = "source") -> dict:
+    """
+    Runs a producer/consumer pipeline over bounded queues.
+
+    `source` is an iterable consumed on its own thread. `stages` is a list of
+    (name, fn, workers) tuples: every item is passed through each stage's fn in
+    turn, and a stage's return value is handed to the next stage. Each queue
+    holds at most `queue_size` items, so the number of in-flight items stays
+    bounded and a slow stage applies back-pressure to the ones before it.
+
+    The first exception raised anywhere stops the pipeline and is re-raised.
+    Returns the busy time in seconds and the item count per stage.
+    Worker threads run in a copy of the caller's context, so request-scoped
+    context variables (such as the request ID) follow the items.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stop = threading.Event()
+    errors = []
+    stats_lock = threading.Lock()
+    stats = {name: {'seconds': 0.0, 'items': 0} for name in [source_name] + [s[0] for s in stages]}
+    # Workers still running per stage; the last one to finish closes the next queue
+    remaining = [workers for _, _, workers in stages]
+
+    def record(name: str, seconds: float):
+        with stats_lock:
+            stats[name]['seconds'] += seconds
+            stats[name]['items'] += 1
+
+    def fail(error: BaseException):
+        with stats_lock:
+            errors.append(error)
+        stop.set()
+
+    def put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(stage_index: int):
+        """Sends one end marker per worker of the given stage."""
+        if stage_index < len(stages):
+            for _ in range(stages[stage_index][2]):
+                if not put(queues[stage_index], _DONE):
+                    return
+
+    def feed():
+        try:
+            items = iter(source)
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                record(source_name, time.perf_counter() - started)
+                if not put(queues[0], item):
+                    return
+        except BaseException as e:
+            fail(e)
+        finally:
+            close(0)
+
+    def work(stage_index: int):
+        name, fn, _ = stages[stage_index]
+        inbox = queues[stage_index]
+        try:
+            while not stop.is_set():
+                try:
+                    item = inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                started = time.perf_counter()
+                result = fn(item)
+                record(name, time.perf_counter() - started)
+                if stage_index + 1 < len(stages) and not put(queues[stage_index + 1], result):
+                    return
+        except BaseException as e:
+            fail(e)
+        finally:
+            with stats_lock:
+                remaining[stage_index] -= 1
+                last = remaining[stage_index] == 0
+            if last:
+                close(stage_index + 1)
+
+    # One context copy per thread: a Context cannot be entered by two threads at once
+    threads = [threading.Thread(
+        target=contextvars.copy_context().run, args=(feed,), name=f"pipeline-{source_name}", daemon=True
+    )]
+    for stage_index, (name, _, workers) in enumerate(stages):
+        for worker in range(workers):
+            threads.append(threading.Thread(
+                target=contextvars.copy_context().run, args=(work, stage_index),
+                name=f"pipeline-{name}-{worker}", daemon=True
+            ))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return stats
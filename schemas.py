@@ -1,11 +1,37 @@
 # File: schemas.py
 
-from pydantic import BaseModel, Field
-from typing import List
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional, Union
 
 class RunRequest(BaseModel):
-    documents: str = Field(..., description="URL of the PDF document to process.")
+    documents: Union[str, List[str]] = Field(
+        ..., description="URL of the PDF document to process, or a list of URLs to answer across."
+    )
     questions: List[str] = Field(..., description="List of questions to answer based on the document.")
+    deadline_seconds: Optional[float] = Field(
+        None, gt=0, description="Time budget for the whole request; defaults to REQUEST_DEADLINE_SECONDS."
+    )
+
+    @field_validator("documents")
+    @classmethod
+    def documents_not_empty(cls, documents):
+        if not documents:
+            raise ValueError("at least one document URL is required")
+        return documents
+
+    def document_urls(self) -> List[str]:
+        """The requested document URLs, in order and without duplicates."""
+        urls = [self.documents] if isinstance(self.documents, str) else self.documents
+        return list(dict.fromkeys(urls))
+
+class StreamRunRequest(RunRequest):
+    stream_tokens: bool = Field(False, description="Also stream answer tokens as the LLM generates them.")
 
 class RunResponse(BaseModel):
-    answers: List[str] = Field(..., description="List of answers corresponding to the questions.")
\ No newline at end of file
+    answers: List[str] = Field(..., description="List of answers corresponding to the questions.")
+
+class DocumentsRequest(BaseModel):
+    documents: List[str] = Field(..., description="URLs of PDF documents to ingest ahead of time.")
+    refresh: bool = Field(
+        False, description="Re-download already ingested documents and update only the chunks that changed."
+    )
@@ -0,0 +1,149 @@
+# File: single_flight.py
+
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from metrics import log
+
+class FlightFailed(RuntimeError):
+    """Raised to callers in other processes when the call they waited for failed."""
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time across the threads of this
+    process and the worker processes sharing `path`.
+
+    In-process, later callers wait on the first caller's Future and get
+    its result or its exception. Across processes, the caller holding the
+    key's sqlite lease runs the call while callers elsewhere poll until it
+    finishes; they then run the call themselves (by then it finds the work
+    done) or raise FlightFailed if it failed. The lease is renewed while
+    the call runs, so a crashed worker's lease expires after lease_seconds.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 30.0, poll_interval: float = 0.2):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.flights = {}  # key -> Future of the in-process call
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One shared connection; WAL lets several workers read while one writes
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self.db_lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS flights (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL, "
+            "state TEXT NOT NULL, error TEXT, finished_at REAL)"
+        )
+
+    def run(self, key: str, fn, *args):
+        """Returns fn(*args), or the result of the identical call already in flight."""
+        with self.lock:
+            future = self.flights.get(key)
+            leader = future is None
+            if leader:
+                future = self.flights[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._run_leased(key, fn, args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.flights[key]
+
+    # --- Cross-process lease ---
+    def _run_leased(self, key: str, fn, args: tuple):
+        waited_since = None
+        previous = self._acquire(key)
+        while previous is None:
+            waited_since = waited_since or time.time()
+            time.sleep(self.poll_interval)
+            previous = self._acquire(key)
+        if waited_since is not None:
+            # Another worker ran the call while we waited: share its failure
+            state, error, finished_at = previous
+            if state == "failed" and finished_at >= waited_since:
+                self._release(key, "failed", error)
+                raise FlightFailed(f"Concurrent call for {key} failed in another worker: {error}")
+
+        stop_renewing = threading.Event()
+        # Logs under the ID of the request holding the lease
+        renewer = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._renew, key, stop_renewing), daemon=True
+        )
+        renewer.start()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            stop_renewing.set()
+            self._release(key, "failed", str(e) or type(e).__name__)
+            raise
+        stop_renewing.set()
+        self._release(key, "done")
+        return result
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self.db_lock:
+            return self.db.execute(sql, params).fetchone()
+
+    def _acquire(self, key: str):
+        """
+        Takes the key's lease and returns the (state, error, finished_at) of
+        the call before ours, or returns None while another live call holds it.
+        """
+        now = time.time()
+        with self.db_lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT state, error, finished_at, expires_at FROM flights WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    previous = (None, None, 0.0)
+                elif row[0] == "running" and row[3] > now:
+                    return None
+                else:
+                    previous = (row[0], row[1], row[2] or 0.0)
+                self.db.execute(
+                    "INSERT INTO flights (key, owner, expires_at, state, error, finished_at) "
+                    "VALUES (?, ?, ?, 'running', NULL, NULL) ON CONFLICT(key) DO UPDATE SET "
+                    "owner = excluded.owner, expires_at = excluded.expires_at, state = 'running'",
+                    (key, self.owner, now + self.lease_seconds)
+                )
+                return previous
+            finally:
+                self.db.execute("COMMIT")
+
+    def _renew(self, key: str, stop: threading.Event):
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                self._execute(
+                    "UPDATE flights SET expires_at = ? WHERE key = ? AND owner = ? AND state = 'running'",
+                    (time.time() + self.lease_seconds, key, self.owner)
+                )
+            except sqlite3.Error as e:
+                log(f"Could not renew lease on {key}: {e}")
+
+    def _release(self, key: str, state: str, error: str = None):
+        try:
+            self._execute(
+                "UPDATE flights SET state = ?, error = ?, finished_at = ?, owner = NULL, expires_at = NULL "
+                "WHERE key = ? AND owner = ?",
+                (state, error, time.time(), key, self.owner)
+            )
+        except sqlite3.Error as e:
+            log(f"Could not release lease on {key}: {e}")
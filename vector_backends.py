@@ -0,0 +1,317 @@
+# File: vector_backends.py
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from metrics import log
+
+# Queries sent at once by the default query_many()
+QUERY_MANY_CONCURRENCY = 8
+# Pinecone deletes at most this many IDs per request
+PINECONE_DELETE_BATCH = 1000
+
+class VectorBackend:
+    """Minimal interface the vector store needs: upsert, query, delete and stats per namespace."""
+
+    # True when upserts are only durable after flush(); otherwise each upsert is durable on return
+    buffers_upserts = False
+
+    def upsert(self, vectors: list, namespace: str):
+        """Inserts or replaces vectors given as {'id', 'values', 'metadata'} dicts."""
+        raise NotImplementedError
+
+    def flush(self, namespace: str):
+        """Persists the namespace's buffered upserts, if the backend buffers them."""
+
+    def query(self, vector: list, top_k: int, namespace: str, include_metadata: bool = True) -> list:
+        """Returns up to top_k matches as {'id', 'score', 'metadata'} dicts, best first."""
+        raise NotImplementedError
+
+    def query_many(self, vectors: list, top_k: int, namespace: str, include_metadata: bool = True) -> list:
+        """Returns query()'s matches for each vector, in order. By default the queries run concurrently."""
+        if len(vectors) <= 1:
+            return [self.query(vector, top_k, namespace, include_metadata) for vector in vectors]
+        with ThreadPoolExecutor(max_workers=min(len(vectors), QUERY_MANY_CONCURRENCY)) as pool:
+            return list(pool.map(lambda vector: self.query(vector, top_k, namespace, include_metadata), vectors))
+
+    def delete(self, namespace: str, ids: list = None):
+        """Deletes the given IDs, or the whole namespace when ids is None."""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Returns the vector count of every namespace."""
+        raise NotImplementedError
+
+    def namespace_count(self, namespace: str) -> int:
+        return self.stats().get(namespace, 0)
+
+# --- Pinecone ---
+class PineconeBackend(VectorBackend):
+    """Backend that forwards every call to a remote Pinecone index."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors: list, namespace: str):
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector: list, top_k: int, namespace: str, include_metadata: bool = True) -> list:
+        results = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            namespace=namespace
+        )
+        return [
+            {'id': match['id'], 'score': match['score'], 'metadata': match.get('metadata') or {}}
+            for match in results['matches']
+        ]
+
+    def delete(self, namespace: str, ids: list = None):
+        if ids is None:
+            self.index.delete(delete_all=True, namespace=namespace)
+        else:
+            for i in range(0, len(ids), PINECONE_DELETE_BATCH):
+                self.index.delete(ids=ids[i:i + PINECONE_DELETE_BATCH], namespace=namespace)
+
+    def stats(self) -> dict:
+        stats = self.index.describe_index_stats()
+        return {name: ns.vector_count for name, ns in stats.namespaces.items()}
+
+# --- Local (in-process NumPy) ---
+class _LocalNamespace:
+    """Vectors of one namespace: normalized float32 rows plus their IDs and metadata."""
+
+    def __init__(self, dimension: int, matrix: np.ndarray = None):
+        self.ids = []
+        self.metadata = []
+        self.positions = {}
+        self.matrix = np.empty((0, dimension), dtype=np.float32) if matrix is None else matrix
+        # `matrix` is a view of the first rows of `rows`; the spare rows let appends grow it in amortized O(1)
+        self.rows = self.matrix
+
+    def _append(self, new_rows: np.ndarray):
+        count = self.matrix.shape[0]
+        needed = count + len(new_rows)
+        if needed > self.rows.shape[0]:
+            grown = np.empty((max(needed, 2 * self.rows.shape[0]), self.rows.shape[1]), dtype=np.float32)
+            grown[:count] = self.matrix
+            self.rows = grown
+        # Rows past the current view are not visible to a query holding the old one
+        self.rows[count:needed] = new_rows
+        self.matrix = self.rows[:needed]
+
+    def upsert(self, vectors: list):
+        values = np.asarray([v['values'] for v in vectors], dtype=np.float32)
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values /= np.maximum(norms, 1e-12)
+
+        new_rows = []
+        for vector, row in zip(vectors, values):
+            position = self.positions.get(vector['id'])
+            if position is None:
+                self.positions[vector['id']] = len(self.ids)
+                self.ids.append(vector['id'])
+                self.metadata.append(vector.get('metadata') or {})
+                new_rows.append(row)
+            else:
+                self.matrix[position] = row
+                self.metadata[position] = vector.get('metadata') or {}
+        if new_rows:
+            self._append(np.asarray(new_rows, dtype=np.float32))
+
+    def delete(self, ids: list):
+        doomed = {self.positions[i] for i in ids if i in self.positions}
+        if not doomed:
+            return
+        keep = [p for p in range(len(self.ids)) if p not in doomed]
+        self.ids = [self.ids[p] for p in keep]
+        self.metadata = [self.metadata[p] for p in keep]
+        self.matrix = self.rows = self.matrix[keep]
+        self.positions = {vector_id: p for p, vector_id in enumerate(self.ids)}
+
+    def query(self, vector, top_k: int, include_metadata: bool) -> list:
+        return self.query_many([vector], top_k, include_metadata)[0]
+
+    def query_many(self, vectors: list, top_k: int, include_metadata: bool) -> list:
+        # Snapshot so a concurrent upsert cannot change the rows under us
+        matrix, ids, metadata = self.matrix, self.ids, self.metadata
+        count = min(matrix.shape[0], len(ids))
+        if count == 0 or top_k <= 0 or not vectors:
+            return [[] for _ in vectors]
+        queries = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        # Exact cosine: one matmul of all queries against the normalized rows,
+        # then a partial sort of the top k in each row
+        scores = queries @ matrix[:count].T
+        k = min(top_k, count)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [
+                {
+                    'id': ids[p],
+                    'score': float(score),
+                    'metadata': metadata[p] if include_metadata else {}
+                }
+                for p, score in zip(row, row_scores)
+            ]
+            for row, row_scores in zip(top.tolist(), top_scores.tolist())
+        ]
+
+class LocalBackend(VectorBackend):
+    """
+    In-memory exact cosine index, one float32 matrix per namespace.
+    Each namespace is persisted as <namespace>.npy + <namespace>.json under `path`.
+    Workers sharing `path` see each other's writes: a namespace is reloaded
+    whenever its file on disk is newer than the copy in memory.
+
+    Upserts are buffered in memory and written by flush() (or the next
+    delete), so an ingestion rewrites its namespace once rather than once per
+    batch. Until then only this worker sees them.
+    """
+
+    buffers_upserts = True
+
+    def __init__(self, path: str, dimension: int):
+        self.path = path
+        self.dimension = dimension
+        self.namespaces = {}
+        self.versions = {}  # namespace -> (inode, mtime_ns) of the .json the loaded copy matches
+        self.unsaved = set()  # namespaces with upserts not yet written
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _files(self, namespace: str):
+        return (
+            os.path.join(self.path, f"{namespace}.npy"),
+            os.path.join(self.path, f"{namespace}.json")
+        )
+
+    def _load(self):
+        for namespace in self._namespaces_on_disk():
+            self._namespace(namespace)
+        if self.namespaces:
+            log(f"Loaded {len(self.namespaces)} namespaces from {self.path}")
+
+    def _namespaces_on_disk(self) -> list:
+        return [filename[:-len(".json")] for filename in os.listdir(self.path) if filename.endswith(".json")]
+
+    @staticmethod
+    def _version(meta_file: str) -> tuple:
+        # Every save replaces the file, so its inode changes even within one mtime tick
+        stat = os.stat(meta_file)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _namespace(self, namespace: str):
+        """The namespace's vectors as last written by any worker, or None if it does not exist."""
+        matrix_file, meta_file = self._files(namespace)
+        with self.lock:
+            if namespace in self.unsaved:
+                # Buffered upserts are kept: the ingestion writing them holds the document's lease
+                return self.namespaces.get(namespace)
+        # A second attempt covers another worker rewriting the files while we read them
+        for attempt in range(2):
+            try:
+                version = self._version(meta_file)
+            except OSError:
+                with self.lock:
+                    self.namespaces.pop(namespace, None)
+                    self.versions.pop(namespace, None)
+                return None
+            with self.lock:
+                if self.versions.get(namespace) == version:
+                    return self.namespaces.get(namespace)
+            try:
+                with open(meta_file, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                matrix = np.load(matrix_file).astype(np.float32, copy=False)
+                if matrix.shape[0] != len(meta['ids']) or self._version(meta_file) != version:
+                    raise ValueError("namespace changed while loading")
+            except Exception as e:
+                if attempt:
+                    log(f"Warning: Could not load local namespace {namespace}: {e}")
+                    with self.lock:
+                        return self.namespaces.get(namespace)
+                continue
+            ns = _LocalNamespace(self.dimension, matrix)
+            ns.ids = meta['ids']
+            ns.metadata = meta['metadata']
+            ns.positions = {vector_id: p for p, vector_id in enumerate(ns.ids)}
+            with self.lock:
+                self.namespaces[namespace] = ns
+                self.versions[namespace] = version
+            return ns
+
+    def _save(self, namespace: str):
+        matrix_file, meta_file = self._files(namespace)
+        ns = self.namespaces.get(namespace)
+        if ns is None:
+            for filename in (matrix_file, meta_file):
+                if os.path.exists(filename):
+                    os.remove(filename)
+            self.versions.pop(namespace, None)
+            self.unsaved.discard(namespace)
+            return
+        # Write to temp files and rename so a crash never leaves a torn namespace
+        np.save(matrix_file + ".tmp.npy", ns.matrix)
+        os.replace(matrix_file + ".tmp.npy", matrix_file)
+        with open(meta_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({'ids': ns.ids, 'metadata': ns.metadata}, f)
+        os.replace(meta_file + ".tmp", meta_file)
+        self.versions[namespace] = self._version(meta_file)
+        self.unsaved.discard(namespace)
+
+    def upsert(self, vectors: list, namespace: str):
+        if not vectors:
+            return
+        with self.lock:
+            # Start from what other workers wrote, so their vectors are not overwritten
+            if self._namespace(namespace) is None:
+                self.namespaces[namespace] = _LocalNamespace(self.dimension)
+            self.namespaces[namespace].upsert(vectors)
+            self.unsaved.add(namespace)
+
+    def flush(self, namespace: str):
+        with self.lock:
+            if namespace in self.unsaved:
+                self._save(namespace)
+
+    def query(self, vector: list, top_k: int, namespace: str, include_metadata: bool = True) -> list:
+        ns = self._namespace(namespace)
+        if ns is None:
+            return []
+        return ns.query(vector, top_k, include_metadata)
+
+    def query_many(self, vectors: list, top_k: int, namespace: str, include_metadata: bool = True) -> list:
+        ns = self._namespace(namespace)
+        if ns is None:
+            return [[] for _ in vectors]
+        return ns.query_many(vectors, top_k, include_metadata)
+
+    def delete(self, namespace: str, ids: list = None):
+        with self.lock:
+            if ids is None:
+                self.namespaces.pop(namespace, None)
+            elif self._namespace(namespace) is not None:
+                self.namespaces[namespace].delete(ids)
+            self._save(namespace)
+
+    def stats(self) -> dict:
+        counts = {}
+        for namespace in self._namespaces_on_disk():
+            ns = self._namespace(namespace)
+            if ns is not None:
+                counts[namespace] = len(ns.ids)
+        return counts
+
+    def namespace_count(self, namespace: str) -> int:
+        ns = self._namespace(namespace)
+        return len(ns.ids) if ns is not None else 0
@@ -1,141 +1,558 @@
 # File: vector_store.py
 
-from pinecone import Pinecone, ServerlessSpec
-from config import PINECONE_API_KEY, PINECONE_INDEX_NAME
-from llm_services import get_embedding, get_embeddings_from_jina
-from document_processor import process_documents
+from config import (
+    PINECONE_API_KEY, PINECONE_INDEX_NAME, VECTOR_BACKEND, LOCAL_INDEX_DIR, EMBEDDING_DIMENSION,
+    EMBEDDING_BATCH_TOKENS, EMBEDDING_BATCH_MAX_ITEMS, EMBEDDING_MAX_CONCURRENCY, INGEST_QUEUE_SIZE,
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, DOCUMENT_MANIFEST_PATH, INGEST_LEASE_PATH, INGEST_LEASE_SECONDS,
+    HYBRID_SEARCH, HYBRID_CANDIDATES, RRF_K, LEXICAL_INDEX_DIR, CHUNK_MANIFEST_DIR, CHUNK_STORE_DIR,
+    CONTEXT_TOKEN_BUDGET, CONTEXT_EXPAND_NEIGHBOURS, EMBEDDING_MODEL
+)
+from llm_services import get_embedding, get_embeddings_from_jina, estimate_tokens
+from document_processor import iter_document_chunks
+from downloader import download
+from vector_backends import PineconeBackend, LocalBackend
+from pipeline import run_pipeline, batched
+from answer_cache import AnswerCache
+from lexical_index import BM25Builder, LexicalIndexStore, reciprocal_rank_scores
+from chunk_store import ChunkStore
+from context_builder import build_context
+from single_flight import SingleFlight
+from document_manifest import DocumentManifest
+from metrics import span, log
 import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-# --- Initialize Pinecone ---
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
+# --- Initialize Vector Backend ---
 def init_pinecone():
     """Initializes the Pinecone index, creating it if it doesn't exist."""
+    from pinecone import Pinecone, ServerlessSpec
+    pc = Pinecone(api_key=PINECONE_API_KEY)
     if PINECONE_INDEX_NAME not in pc.list_indexes().names():
-        print(f"Creating new Pinecone index: {PINECONE_INDEX_NAME}")
+        log(f"Creating new Pinecone index: {PINECONE_INDEX_NAME}")
         pc.create_index(
             name=PINECONE_INDEX_NAME,
-            dimension=768,  # Dimension for Jina's jina-embeddings-v2-base-en
+            dimension=EMBEDDING_DIMENSION,
             metric='cosine',
             spec=ServerlessSpec(cloud='aws', region='us-east-1')
         )
     else:
         # Check if existing index has the correct dimension
         index_info = pc.describe_index(PINECONE_INDEX_NAME)
-        if index_info.dimension != 768:
-            print(f"Warning: Existing index has dimension {index_info.dimension}, but expected 768")
-            print("You may need to delete the existing index and recreate it with the correct dimension")
+        if index_info.dimension != EMBEDDING_DIMENSION:
+            log(f"Warning: Existing index has dimension {index_info.dimension}, but expected {EMBEDDING_DIMENSION}")
+            log("You may need to delete the existing index and recreate it with the correct dimension")
     return pc.Index(PINECONE_INDEX_NAME)
 
-index = init_pinecone()
+def init_backend():
+    """Creates the configured vector backend ("pinecone" or the in-process "local" index)."""
+    if VECTOR_BACKEND == "local":
+        log(f"Using local vector backend at {LOCAL_INDEX_DIR}")
+        return LocalBackend(LOCAL_INDEX_DIR, EMBEDDING_DIMENSION)
+    return PineconeBackend(init_pinecone())
+
+# Connected on first use rather than at import: connecting to Pinecone makes
+# network calls, and an upstream hiccup must not keep the server from booting.
+# A failed attempt is not cached, so the next call retries.
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """The configured vector backend, created (and the index checked) on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = init_backend()
+    return _backend
+
+# Status, source and content of every ingested document, shared by all workers
+document_manifest = DocumentManifest(DOCUMENT_MANIFEST_PATH)
 
-# --- THE FIX IS HERE ---
-# We are adding namespace="" to the delete and upsert calls.
-DEFAULT_NAMESPACE = ""
+# BM25 indexes per namespace, kept on disk beside the vectors
+lexical_indexes = LexicalIndexStore(LEXICAL_INDEX_DIR)
 
-# Document cache to avoid reprocessing same documents
-processed_documents = set()
+# Chunk text per namespace, so vectors are stored and queried without metadata
+chunk_store = ChunkStore(CHUNK_STORE_DIR)
+
+# Generated answers per document; cleared whenever the document is re-ingested
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD)
+
+# At most one ingestion per document at a time, across threads and workers
+ingestions = SingleFlight(INGEST_LEASE_PATH, INGEST_LEASE_SECONDS)
 
 def get_document_hash(url: str) -> str:
     """Generate a hash for the document URL to use as cache key."""
     return hashlib.md5(url.encode()).hexdigest()[:8]
 
-def is_document_processed(url: str) -> bool:
-    """Check if document has already been processed."""
+def get_documents_key(urls) -> str:
+    """
+    Answer cache key for questions asked across one or more documents: each
+    document's hash with the content it was ingested from, so once a
+    document changes, no worker reuses answers about its old version.
+    """
+    urls = [urls] if isinstance(urls, str) else urls
+    parts = set()
+    for url in urls:
+        doc_hash = get_document_hash(url)
+        record = document_manifest.get(doc_hash)
+        content_hash = record.content_hash if record is not None else None
+        parts.add(f"{doc_hash}:{content_hash[:16]}" if content_hash else doc_hash)
+    return "+".join(sorted(parts))
+
+def get_namespace(url: str) -> str:
+    """Each document lives in its own namespace, keyed by its hash, unless it shares another URL's content."""
     doc_hash = get_document_hash(url)
-    try:
-        # Check if any vectors exist with this document hash
-        stats = index.describe_index_stats()
-        if stats.total_vector_count > 0:
-            # Assume document is already processed if vectors exist
-            print(f"Document already processed (vectors exist: {stats.total_vector_count})")
-            return True
-    except Exception as e:
-        print(f"Error checking document status: {e}")
+    record = document_manifest.get(doc_hash)
+    return record.namespace if record is not None else doc_hash
+
+def _is_ready(record) -> bool:
+    """True once the document's ingestion is published; an "empty" document (no text) is settled too."""
+    return record is not None and record.status in ("ready", "empty") and record.embedding_model == EMBEDDING_MODEL
+
+def published_result(url: str):
+    """
+    process_and_store_documents()' "cached" result for a document whose
+    ingestion is published, from a local manifest lookup; None otherwise.
+    """
+    doc_hash = get_document_hash(url)
+    record = document_manifest.get(doc_hash)
+    if not _is_ready(record):
+        return None
+    return {
+        'doc_hash': doc_hash, 'namespace': record.namespace,
+        'status': "empty" if record.status == "empty" else "cached", 'chunks': record.chunk_count,
+        'added': 0, 'kept': 0, 'removed': 0, 'timings': {}
+    }
+
+def is_document_processed(url: str) -> bool:
+    """Check the manifest for a finished ingestion of this document; no vector store round trip."""
+    record = document_manifest.get(get_document_hash(url))
+    if _is_ready(record):
+        log(f"Document already processed (namespace {record.namespace}: {record.chunk_count} chunks)")
+        return True
+    if record is not None and record.status not in ("ready", "empty"):
+        log(f"Document found with status {record.status!r}; ingesting it again")
+    elif record is not None:
+        log(f"Document was embedded with {record.embedding_model}; ingesting it again")
     return False
 
-def upsert_chunks(vectors: list):
-    """Upserts pre-computed vectors into Pinecone."""
-    print(f"Upserting {len(vectors)} vectors to Pinecone")
-    # Upsert in batches for speed
-    batch_size = 100
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i:i + batch_size]
-        batch_num = i // batch_size + 1
-        total_batches = (len(vectors) + batch_size - 1) // batch_size
-        print(f"Upserting batch {batch_num}/{total_batches} ({len(batch)} vectors)")
-        index.upsert(vectors=batch, namespace=DEFAULT_NAMESPACE)
-    print(f"Successfully upserted {len(vectors)} vectors")
-
-def process_and_store_documents(url: str):
-    """Process documents from URL and store in vector database with caching."""
-    print(f"Processing document from URL: {url}")
+def _chunk_ids():
+    """
+    Returns a function giving each chunk of one document its vector ID: a hash
+    of its text, so an unchanged chunk keeps its ID when the document is
+    re-ingested. Repeats of the same text within the document get -1, -2...
+    """
+    occurrences = {}
+
+    def chunk_id(chunk) -> str:
+        digest = hashlib.sha256(chunk.text.encode("utf-8")).hexdigest()[:24]
+        seen = occurrences.get(digest, 0)
+        occurrences[digest] = seen + 1
+        return digest if seen == 0 else f"{digest}-{seen}"
+    return chunk_id
+
+# --- Chunk manifests ---
+# The vector IDs stored for each namespace, in chunk order, and the content
+# they were made from; re-ingestion diffs against it instead of starting over.
+
+def _manifest_path(namespace: str) -> str:
+    return os.path.join(CHUNK_MANIFEST_DIR, f"{namespace}.json")
+
+def load_chunk_manifest(namespace: str):
+    """Returns {'content_hash', 'ids'} for the namespace, or None if it has no manifest."""
+    try:
+        with open(_manifest_path(namespace), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_chunk_manifest(namespace: str, content_hash: str, ids: list):
+    os.makedirs(CHUNK_MANIFEST_DIR, exist_ok=True)
+    path = _manifest_path(namespace)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({'content_hash': content_hash, 'ids': ids}, f)
+    os.replace(temp_path, path)
+
+def process_and_store_documents(url: str, refresh: bool = False) -> dict:
+    """
+    Process documents from URL and store in vector database with caching.
+    Concurrent calls for the same document are coalesced: the first one
+    ingests, the others wait for it and share its result or its error
+    (see single_flight.py; in other workers they find the document cached).
+    Download/extraction/chunking, embedding and upsert run as a streaming
+    pipeline, so embedded batches are upserted while later pages are parsed.
+
+    With refresh, a stored document is downloaded again (revalidated) and,
+    if its content changed, re-ingested incrementally: only chunks whose text
+    is new are embedded and upserted, and only vanished ones are deleted.
+
+    Whether a document is stored is looked up in the document manifest
+    (document_manifest.py), not the vector backend. An ingestion that
+    failed or was cut short by a crash is not ready there; the next call
+    resumes it, re-embedding only chunks it had not upserted yet.
+
+    Returns {'doc_hash', 'namespace', 'status', 'chunks', 'added', 'kept',
+    'removed', 'timings'} where status is "cached" (already stored, or
+    unchanged on refresh), "aliased" (same content as another URL),
+    "ingested" or "empty", added/kept/removed count vectors, and timings
+    holds seconds per stage.
+    """
+    if not refresh:
+        # Warm path: a local manifest lookup, without taking the ingestion lease
+        published = published_result(url)
+        if published is not None:
+            log(f"Document already processed (namespace {published['namespace']}: {published['chunks']} chunks)")
+            return published
+    return ingestions.run(get_document_hash(url), _ingest, url, refresh)
+
+def _ingest(url: str, refresh: bool) -> dict:
+    log(f"Processing document from URL: {url}")
+    start_time = time.time()
+    doc_hash = get_document_hash(url)
+    record = document_manifest.get(doc_hash)
+    result = {
+        'doc_hash': doc_hash, 'namespace': record.namespace if record is not None else doc_hash,
+        'status': "cached", 'chunks': record.chunk_count if record is not None else 0,
+        'added': 0, 'kept': 0, 'removed': 0, 'timings': {}
+    }
     
     # Check if document already processed
-    if is_document_processed(url):
-        print("Document already in vector store, skipping processing")
-        return
+    if not refresh and is_document_processed(url):
+        log("Document already in vector store, skipping processing")
+        return result
     
-    # Clear existing vectors to avoid duplicates
+    namespace = doc_hash
+
+    # Download (or revalidate) first: the content hash tells us whether another
+    # URL already ingested the same file
+    with span("download"):
+        document = download(url)
+    result['timings']['download'] = round(time.time() - start_time, 3)
+    backend = get_backend()
+    previous = load_chunk_manifest(namespace)
+    # Recorded before the manifest existed, or ready in its own namespace
+    settled = record is None or (_is_ready(record) and record.namespace == namespace)
+    if settled and previous is not None and previous['content_hash'] == document.content_hash:
+        log("Document unchanged since it was ingested")
+        document_manifest.finish(
+            doc_hash, url, namespace, document.content_hash, document.etag, EMBEDDING_MODEL, len(previous['ids'])
+        )
+        result.update(namespace=namespace, chunks=len(previous['ids']), kept=len(previous['ids']))
+        return result
+    result['namespace'] = namespace
+    shared = document_manifest.find_content(document.content_hash, EMBEDDING_MODEL, exclude=doc_hash)
+    if shared is not None:
+        log(f"Same content already ingested as {shared.namespace}, sharing its namespace")
+        document_manifest.finish(
+            doc_hash, url, shared.namespace, document.content_hash, document.etag, EMBEDDING_MODEL, shared.chunk_count
+        )
+        result.update(status="aliased", namespace=shared.namespace, chunks=shared.chunk_count)
+        return result
+
+    # Answers generated from an earlier version of this document are stale
+    answer_cache.invalidate(doc_hash)
+    if record is not None and record.embedding_model not in (None, EMBEDDING_MODEL):
+        # Vectors from another embedding model cannot be reused
+        backend.delete(namespace)
+        previous, pending = None, []
+    else:
+        pending = document_manifest.pending_vectors(doc_hash)
+        if previous is None and not pending and record is None and backend.namespace_count(namespace) > 0:
+            # Stored before chunk manifests existed, with positional IDs: start over
+            backend.delete(namespace)
+    if pending:
+        log(f"Resuming an unfinished ingestion: {len(pending)} vectors are already stored")
+    previous_ids = set(previous['ids'] if previous is not None else ()) | set(pending)
+    document_manifest.start(doc_hash, url, document.content_hash, document.etag, EMBEDDING_MODEL)
+
+    # The BM25 index and the chunk store are built from the same chunks as they stream past
+    lexical = BM25Builder()
+    chunk_writer = chunk_store.writer(namespace)
+    chunk_id = _chunk_ids()
+
+    def index_locally(chunks):
+        for chunk in chunks:
+            vector_id = chunk_id(chunk)
+            lexical.add(vector_id, chunk.text, chunk.ordinal, chunk.page)
+            chunk_writer.add(vector_id, chunk.text, chunk.ordinal, chunk.page, chunk.start, chunk.end)
+            yield vector_id, chunk
+
+    def new_chunks(items):
+        """Only chunks not stored by an earlier ingestion need embedding."""
+        for vector_id, chunk in items:
+            if vector_id not in previous_ids:
+                yield vector_id, chunk
+
+    def embed_batch(batch: list) -> list:
+        texts = [chunk.text for _, chunk in batch]
+        with span("embed"):
+            embeddings = get_embeddings_from_jina(texts)
+        # IDs and values only: text, page and ordinal live in the local chunk store
+        return [
+            {'id': vector_id, 'values': embedding}
+            for (vector_id, _), embedding in zip(batch, embeddings)
+        ]
+
+    buffered_ids = []
+
+    def upsert_batch(vectors: list):
+        with span("upsert"):
+            backend.upsert(vectors, namespace=namespace)
+        if backend.buffers_upserts:
+            # Not durable until flushed: written and journaled once, at the end
+            buffered_ids.extend(vector['id'] for vector in vectors)
+        else:
+            # Journaled so a retry after a crash or failure skips them
+            document_manifest.add_vectors(doc_hash, [vector['id'] for vector in vectors])
+
     try:
-        index.delete(delete_all=True, namespace=DEFAULT_NAMESPACE)
-        print("Cleared existing vectors")
-        time.sleep(1)  # Brief wait for deletion to complete
-    except Exception as e:
-        print(f"Warning: Could not clear existing vectors: {e}")
-    
-    # Process new document
-    documents = process_documents([url])
-    if not documents:
-        print("No documents processed")
-        return
-    
-    print(f"Processed {len(documents)} document chunks")
-    
-    # Generate embeddings and upsert (optimized batch processing)
-    doc_hash = get_document_hash(url)
-    vectors_to_upsert = []
-    
-    # Process in smaller batches for speed
-    batch_size = 10
-    for i in range(0, len(documents), batch_size):
-        batch = documents[i:i+batch_size]
-        texts = [doc.page_content for doc in batch]
+        try:
+            stats = run_pipeline(
+                # Batches are packed by estimated tokens, not a fixed chunk count
+                batched(
+                    new_chunks(index_locally(iter_document_chunks(url, document.path, doc_hash))),
+                    EMBEDDING_BATCH_MAX_ITEMS,
+                    weight=lambda item: estimate_tokens(item[1].text),
+                    max_weight=EMBEDDING_BATCH_TOKENS
+                ),
+                stages=[
+                    ("embed", embed_batch, EMBEDDING_MAX_CONCURRENCY),
+                    ("upsert", upsert_batch, 1),
+                ],
+                queue_size=INGEST_QUEUE_SIZE,
+                source_name="extract",
+            )
+        except BaseException:
+            chunk_writer.discard()
+            if buffered_ids:
+                # Keep what was upserted before the failure for the retry
+                try:
+                    backend.flush(namespace)
+                    document_manifest.add_vectors(doc_hash, buffered_ids)
+                except Exception as e:
+                    log(f"Could not keep the vectors upserted before the failure: {e}")
+            raise
+        with span("upsert"):
+            backend.flush(namespace)
         
-        print(f"Generating embeddings for batch {i//batch_size + 1}/{(len(documents)-1)//batch_size + 1}")
-        embeddings = get_embeddings_from_jina(texts)
+        for name, stage in stats.items():
+            result['timings'][name] = round(stage['seconds'], 3)
         
-        for j, (doc, embedding) in enumerate(zip(batch, embeddings)):
-            vector_id = f"{doc_hash}_{i+j}"
-            vectors_to_upsert.append({
-                'id': vector_id,
-                'values': embedding,
-                'metadata': {
-                    'text': doc.page_content,
-                    'url': url,
-                    'doc_hash': doc_hash
-                }
-            })
-    
-    # Batch upsert all vectors
-    if vectors_to_upsert:
-        print(f"Upserting {len(vectors_to_upsert)} vectors to Pinecone")
-        upsert_chunks(vectors_to_upsert)
-        processed_documents.add(doc_hash)
-        print("Document processing completed and cached")
-    else:
-        print("No vectors to upsert")
-
-def query_pinecone(question: str, top_k: int = 5):
-    """Queries Pinecone to retrieve relevant text chunks for a question."""
-    query_embedding = get_embedding(question)
-    results = index.query(
-        vector=query_embedding,
-        top_k=top_k,
-        include_metadata=True,
-        namespace=DEFAULT_NAMESPACE # Query from the same namespace
+        if lexical.ids:
+            index_start = time.time()
+            with span("index"):
+                lexical_indexes.put(namespace, lexical.build())
+                chunk_store.put(namespace, chunk_writer)
+            result['timings']['index'] = round(time.time() - index_start, 3)
+            current_ids = set(lexical.ids)
+            stale_ids = [vector_id for vector_id in previous_ids if vector_id not in current_ids]
+            if stale_ids:
+                backend.delete(namespace, ids=stale_ids)
+            _save_chunk_manifest(namespace, document.content_hash, lexical.ids)
+            document_manifest.finish(
+                doc_hash, url, namespace, document.content_hash, document.etag, EMBEDDING_MODEL, len(lexical.ids)
+            )
+            kept = len(current_ids & previous_ids)
+            result.update(
+                status="ingested", chunks=len(lexical.ids),
+                added=len(lexical.ids) - kept, kept=kept, removed=len(stale_ids)
+            )
+            timings = ", ".join(f"{name} {stage['seconds']:.2f}s/{stage['items']} batches" for name, stage in stats.items())
+            log(f"Document processing completed and cached ({timings}); "
+                f"{result['added']} chunks added, {kept} kept, {len(stale_ids)} removed")
+        else:
+            chunk_writer.discard()
+            document_manifest.finish(
+                doc_hash, url, namespace, document.content_hash, document.etag, EMBEDDING_MODEL, 0, status="empty"
+            )
+            result['status'] = "empty"
+            log("No documents processed")
+    except BaseException as e:
+        document_manifest.fail(doc_hash, str(e) or type(e).__name__)
+        raise
+    result['timings']['total'] = round(time.time() - start_time, 3)
+    return result
+
+def _indexes(url: str) -> tuple:
+    """(namespace, chunk store view, BM25 index) of the document; either index may be None."""
+    namespace = get_namespace(url)
+    return namespace, chunk_store.get(namespace), lexical_indexes.get(namespace)
+
+def _hit(match: dict, chunks):
+    """Resolves a vector ID to its chunk: from the local chunk store, else vector metadata."""
+    chunk = chunks.chunk(match['id']) if chunks is not None else None
+    if chunk is not None:
+        return {'id': match['id'], **chunk}
+    metadata = match['metadata']
+    if 'text' not in metadata:
+        return None  # Upserted by a re-ingestion that has not published its chunks yet
+    return {'id': match['id'], 'text': metadata['text'], 'chunk': metadata.get('chunk'), 'page': metadata.get('page')}
+
+def _candidates(lexical, top_k: int) -> int:
+    return max(top_k, HYBRID_CANDIDATES) if lexical is not None and HYBRID_SEARCH else top_k
+
+def _candidate_hits(question: str, matches: list, chunks, lexical, candidates: int) -> list:
+    """
+    One document's candidate hits for a question: its dense matches, each with
+    its cosine 'similarity', and under HYBRID_SEARCH its BM25 matches, each
+    with its 'bm25' score. A chunk found both ways carries both.
+    """
+    hits = {}
+    for match in matches:
+        hit = _hit(match, chunks)
+        if hit is not None:
+            hit['similarity'] = match['score']
+            hits[match['id']] = hit
+    if lexical is None or not HYBRID_SEARCH:
+        return list(hits.values())
+
+    for position, score in lexical.search(question, candidates):
+        chunk_id = lexical.ids[position]
+        if chunk_id not in hits:
+            chunk = chunks.chunk(chunk_id) if chunks is not None else None
+            if chunk is None:
+                continue  # Indexed before the chunk store existed; only dense matches carry its text
+            hits[chunk_id] = {'id': chunk_id, **chunk}
+        hits[chunk_id]['bm25'] = score
+    return list(hits.values())
+
+def _rank(hits: list, top_k: int, hybrid: bool = True) -> list:
+    """
+    The top_k of candidate hits from one document or several, by reciprocal
+    rank fusion of a single dense ranking (by cosine similarity) and a single
+    BM25 ranking (by BM25 score) over all of them. Both rankings span every
+    document, so a hit's fused 'score' is comparable across documents.
+    Pass hybrid=False when some document has no BM25 index: its chunks have
+    no lexical ranks, so every hit is then ranked by similarity alone.
+    """
+    positions = range(len(hits))
+    dense = sorted((i for i in positions if 'similarity' in hits[i]), key=lambda i: hits[i]['similarity'], reverse=True)
+    lexical = []
+    if hybrid:
+        lexical = sorted((i for i in positions if 'bm25' in hits[i]), key=lambda i: hits[i]['bm25'], reverse=True)
+    scores = reciprocal_rank_scores([dense, lexical], k=RRF_K)
+    for i, score in scores.items():
+        hits[i]['score'] = score
+    # Similarity breaks score ties, e.g. a dense-only hit against a lexical-only one
+    return heapq.nlargest(top_k, (hits[i] for i in scores), key=lambda hit: (hit['score'], hit.get('similarity', 0.0)))
+
+def retrieve_hits(question: str, url: str, top_k: int = 5, query_embedding: list = None) -> list:
+    """
+    Returns up to top_k {'id', 'text', 'chunk', 'page'} hits for the question, best first.
+    Dense matches from the vector backend are fused with the document's BM25
+    ranking by reciprocal rank fusion, so exact terms ("Section 4.2", "AYUSH")
+    are found even when their embeddings are not the closest.
+    Pass query_embedding when the caller already embedded the question.
+    """
+    if query_embedding is None:
+        query_embedding = get_embedding(question)
+    namespace, chunks, lexical = _indexes(url)
+    candidates = _candidates(lexical, top_k)
+
+    matches = get_backend().query(
+        query_embedding,
+        top_k=candidates,
+        namespace=namespace, # Only search this document's vectors
+        # Vectors carry no text; it is resolved from the local chunk store
+        include_metadata=chunks is None
+    )
+    return _rank(_candidate_hits(question, matches, chunks, lexical, candidates), top_k)
+
+def _assemble(hits: list, chunks) -> list:
+    neighbour_chunk = None
+    if chunks is not None and CONTEXT_EXPAND_NEIGHBOURS:
+        neighbour_chunk = lambda _, ordinal: chunks.chunk_at(ordinal)
+    return build_context(hits, CONTEXT_TOKEN_BUDGET, neighbour_chunk)
+
+def retrieve_chunks(question: str, url: str, top_k: int = 5, query_embedding: list = None) -> list:
+    """
+    Returns the passages to show the LLM for a question: the retrieved hits
+    assembled within CONTEXT_TOKEN_BUDGET, with overlapping neighbours merged
+    and near-duplicates dropped.
+    """
+    with span("retrieve"):
+        _, chunks, _ = _indexes(url)
+        return _assemble(retrieve_hits(question, url, top_k, query_embedding), chunks)
+
+def _document_hits(questions: list, url: str, query_embeddings: list, top_k: int) -> tuple:
+    """
+    Candidate hits per question from one document, each tagged with the
+    document; plus its chunk lookup and whether it has a BM25 index.
+    """
+    namespace, chunks, lexical = _indexes(url)
+    candidates = _candidates(lexical, top_k)
+    matches = get_backend().query_many(
+        query_embeddings, top_k=candidates, namespace=namespace, include_metadata=chunks is None
     )
-    # Combine the text from the retrieved chunks into a single context string
-    context = "\n---\n".join([match['metadata']['text'] for match in results['matches']])
-    return context
\ No newline at end of file
+    hits = [
+        _candidate_hits(question, question_matches, chunks, lexical, candidates)
+        for question, question_matches in zip(questions, matches)
+    ]
+    for question_hits in hits:
+        for hit in question_hits:
+            hit['document'] = url
+    return hits, chunks, lexical is not None
+
+def document_label(url: str, page) -> str:
+    """Source line put above each passage when a request spans several documents."""
+    name = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1] or url
+    return f"[{name}, page {page}]" if page is not None else f"[{name}]"
+
+def retrieve_chunks_many(questions: list, urls, top_k: int = 5, query_embeddings: list = None) -> list:
+    """
+    retrieve_chunks() for all of a request's questions at once; returns one
+    passage list per question, in order. The questions are embedded in one
+    batched call (unless query_embeddings are given) and the backend runs
+    their top-k lookups together: concurrently on Pinecone, as a single
+    matrix product on the local index.
+
+    `urls` is one document URL or a list of them. With several documents,
+    every document is searched concurrently, each question's candidates from
+    all of them are ranked together into one global top_k, and each passage is labelled with its document
+    and page.
+    """
+    if not questions:
+        return []
+    urls = [urls] if isinstance(urls, str) else list(urls)
+    if query_embeddings is None:
+        query_embeddings = get_embeddings_from_jina(questions)
+    with span("retrieve"):
+        if len(urls) == 1:
+            results = [_document_hits(questions, urls[0], query_embeddings, top_k)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+                results = list(pool.map(lambda url: _document_hits(questions, url, query_embeddings, top_k), urls))
+
+        lookups = {url: lookup for url, (_, lookup, _) in zip(urls, results)}
+        hybrid = all(has_lexical for _, _, has_lexical in results)
+        neighbour_chunk = None
+        if CONTEXT_EXPAND_NEIGHBOURS:
+            def neighbour_chunk(url: str, ordinal: int):
+                lookup = lookups.get(url)
+                return lookup.chunk_at(ordinal) if lookup is not None else None
+        label = document_label if len(urls) > 1 else None
+
+        contexts = []
+        for position, question in enumerate(questions):
+            candidates = itertools.chain.from_iterable(hits[position] for hits, _, _ in results)
+            hits = _rank(list(candidates), top_k, hybrid)
+            contexts.append(build_context(hits, CONTEXT_TOKEN_BUDGET, neighbour_chunk, label=label))
+        return contexts
+
+def query_pinecone(question: str, url: str, top_k: int = 5, query_embedding: list = None):
+    """Retrieves relevant text chunks for a question, joined into a single context string."""
+    return "\n---\n".join(retrieve_chunks(question, url, top_k, query_embedding))
+
+def query_many(questions: list, urls, top_k: int = 5, query_embeddings: list = None) -> list:
+    """
+    query_pinecone() for many questions with one embedding call, across one
+    document URL or a list of them; returns one context string per question.
+    """
+    return ["\n---\n".join(chunks) for chunks in retrieve_chunks_many(questions, urls, top_k, query_embeddings)]